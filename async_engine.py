@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+
+import io
+import ssl
+import json
+import uuid
+import types
+import signal
+import asyncio
+import logging
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import telegram
+from telegram.error import (Unauthorized, BadRequest, TimedOut, ChatMigrated,
+                            NetworkError, RetryAfter, InvalidToken, Conflict)
+
+import message_delivery
+import webhook_listener
+
+# Defaults for the engine settings in config.json, timeouts in seconds
+ENGINE_DEFAULTS = {
+    'api_url': 'https://api.telegram.org',
+    'connections': 32,
+    'io_workers': 4,
+    'request_timeout': 30,
+    'poll_timeout': 30,
+    'idle_timeout': 20
+}
+
+
+class AsyncBot:
+
+    def __init__(self, token: str, settings: dict):
+
+        api_url = urllib.parse.urlsplit(settings['api_url'])
+
+        self.token = token
+        self.settings = settings
+        self.host = api_url.hostname
+        self.port = api_url.port or (443 if api_url.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if api_url.scheme == 'https' else None
+        self.base_path = f'{api_url.path.rstrip("/")}/bot{token}'
+        self.idle_connections = []
+        self.connection_slots = asyncio.Semaphore(settings['connections'])
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> telegram.Message:
+
+        result = await api_call(self, 'sendMessage', chat_id=chat_id, text=text, **kwargs)
+        return(telegram.Message.de_json(result, self))
+
+    async def send_photo(self, chat_id: int, photo, **kwargs) -> telegram.Message:
+
+        result = await api_call(self, 'sendPhoto', chat_id=chat_id, photo=photo, **kwargs)
+        return(telegram.Message.de_json(result, self))
+
+    async def edit_message_reply_markup(self, chat_id: int = None, message_id: int = None, **kwargs):
+
+        result = await api_call(self, 'editMessageReplyMarkup',
+                                chat_id=chat_id, message_id=message_id, **kwargs)
+        return(telegram.Message.de_json(result, self) if isinstance(result, dict) else result)
+
+    editMessageReplyMarkup = edit_message_reply_markup
+
+    async def answer_callback_query(self, callback_query_id: str, **kwargs) -> bool:
+
+        return(await api_call(self, 'answerCallbackQuery', callback_query_id=callback_query_id, **kwargs))
+
+    async def get_updates(self, offset: int, timeout: int) -> list:
+
+        result = await api_call(self, 'getUpdates', request_timeout=timeout + 10, offset=offset,
+                                timeout=timeout, allowed_updates=['message', 'callback_query'])
+        return([telegram.Update.de_json(update, self) for update in result])
+
+    async def set_webhook(self, url: str, **kwargs) -> bool:
+
+        return(await api_call(self, 'setWebhook', url=url, **kwargs))
+
+    async def delete_webhook(self) -> bool:
+
+        return(await api_call(self, 'deleteWebhook'))
+
+
+def engine_run(config: dict, token: str, handlers: dict):
+
+    asyncio.run(engine_main(config, token, handlers))
+
+
+async def engine_main(config: dict, token: str, handlers: dict):
+
+    settings = dict(ENGINE_DEFAULTS)
+    if config.get('api_url'):
+        settings['api_url'] = config['api_url']
+    settings.update(config.get('async_engine', {}))
+
+    loop = asyncio.get_running_loop()
+    bot = AsyncBot(token, settings)
+
+    engine = {
+        'bot': bot,
+        'handlers': handlers,
+        'updates': asyncio.Queue(),
+        'chat_locks': {},
+        'executor': ThreadPoolExecutor(settings['io_workers'], thread_name_prefix='engine_io'),
+        'stop': asyncio.Event(),
+        'tasks': set()
+    }
+
+    message_delivery.delivery_start_async(config, loop)
+
+    stop_event = engine['stop']
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, stop_event.set)
+
+    # The downloader announces new data, the snapshot is loaded off the loop
+    if hasattr(signal, 'SIGUSR1'):
+        loop.add_signal_handler(signal.SIGUSR1, engine_reload_snapshot, engine)
+
+    if config.get('mode', 'polling') == 'webhook':
+        webhook_settings = webhook_listener.webhook_get_settings(config)
+        server = webhook_listener.webhook_start(
+            webhook_settings, bot, engine_create_queue_adapter(loop, engine['updates']))
+
+        if webhook_settings['url']:
+            webhook_options = {'max_connections': webhook_settings['max_connections']}
+            if webhook_settings['secret_token']:
+                webhook_options['secret_token'] = webhook_settings['secret_token']
+            await bot.set_webhook(webhook_settings['url'], **webhook_options)
+
+        receiver = None
+
+    else:
+        server = None
+        await bot.delete_webhook()
+        receiver = asyncio.create_task(engine_poll(engine, settings))
+
+    dispatcher = asyncio.create_task(engine_dispatch(engine))
+    my_logger.info('Asyncio engine started')
+
+    await stop_event.wait()
+    my_logger.info('Stopping the asyncio engine')
+
+    for task in (receiver, dispatcher):
+        if task is not None:
+            task.cancel()
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+    engine['executor'].shutdown(wait=False)
+
+
+def engine_reload_snapshot(engine: dict):
+
+    my_logger.warning('Signal SIGUSR1 received, loading the new snapshot')
+
+    loop = asyncio.get_running_loop()
+    loop.run_in_executor(engine['executor'], engine['handlers']['prepare'])
+
+
+def engine_create_queue_adapter(loop: asyncio.AbstractEventLoop, updates: asyncio.Queue):
+
+    # The webhook listener runs in threads and only needs a put method
+    class QueueAdapter:
+
+        def put(self, update: telegram.Update):
+            loop.call_soon_threadsafe(updates.put_nowait, update)
+
+    return(QueueAdapter())
+
+
+async def engine_poll(engine: dict, settings: dict):
+
+    offset = 0
+
+    while True:
+        try:
+            updates = await engine['bot'].get_updates(offset, settings['poll_timeout'])
+
+        except RetryAfter as err:
+            my_logger.warning('Polling limited, retry in %s seconds', err.retry_after)
+            await asyncio.sleep(err.retry_after)
+            continue
+
+        except Exception as err:
+            # Conflict, Unauthorized or a bad request do not go away by polling again
+            if isinstance(err, BadRequest) or not isinstance(err, (NetworkError, TimedOut)):
+                my_logger.error('Polling stopped: %s', err)
+                engine['stop'].set()
+                return
+
+            my_logger.warning('Polling failed: %s', err)
+            await asyncio.sleep(1)
+            continue
+
+        for update in updates:
+            offset = update.update_id + 1
+            engine['updates'].put_nowait(update)
+
+
+async def engine_dispatch(engine: dict):
+
+    while True:
+        update = await engine['updates'].get()
+
+        # The loop only keeps weak references, running tasks are held until they are done
+        task = asyncio.create_task(engine_process_update(engine, update))
+        engine['tasks'].add(task)
+        task.add_done_callback(engine['tasks'].discard)
+
+
+async def engine_process_update(engine: dict, update: telegram.Update):
+
+    handlers = engine['handlers']
+    chat_id = update.effective_chat.id if update.effective_chat else None
+
+    # Updates of the same chat are processed in the order they arrived
+    chat_lock = engine['chat_locks'].setdefault(chat_id, {'lock': asyncio.Lock(), 'users': 0})
+    chat_lock['users'] += 1
+
+    try:
+        async with chat_lock['lock']:
+            loop = asyncio.get_running_loop()
+
+            # Snapshot reloads, store lookups and reports read and write files, this is kept off the loop
+            await loop.run_in_executor(engine['executor'], handlers['prepare'])
+
+            handler = engine_get_handler(handlers, update)
+            if handler is not None:
+                await loop.run_in_executor(engine['executor'], handler, update, None)
+
+    except Exception as err:
+        handlers['error'](update, types.SimpleNamespace(error=err))
+
+    finally:
+        chat_lock['users'] -= 1
+        if chat_lock['users'] == 0:
+            del engine['chat_locks'][chat_id]
+
+
+def engine_get_handler(handlers: dict, update: telegram.Update):
+
+    if update.callback_query is not None:
+        return(handlers['button'])
+
+    if update.message is not None and update.message.text and update.message.text.startswith('/'):
+        command = update.message.text.split()[0].split('@')[0][1:]
+        return(handlers['commands'].get(command))
+
+    return(None)
+
+
+async def api_call(bot: AsyncBot, method: str, request_timeout: float = None, **params):
+
+    params = {key: value for key, value in params.items() if value is not None}
+
+    has_file = any(isinstance(value, (io.IOBase, bytes)) for value in params.values())
+    if has_file:
+        body, content_type = api_encode_multipart(params)
+    else:
+        body = json.dumps(params, default=api_encode_object).encode()
+        content_type = 'application/json'
+
+    timeout = request_timeout or bot.settings['request_timeout']
+
+    try:
+        status, response_body = await asyncio.wait_for(
+            api_request(bot, f'{bot.base_path}/{method}', body, content_type), timeout)
+
+    except asyncio.TimeoutError:
+        raise TimedOut()
+
+    except (OSError, asyncio.IncompleteReadError, ValueError) as err:
+        raise NetworkError(f'{method} failed: {err}')
+
+    return(api_get_result(status, response_body))
+
+
+def api_encode_object(value):
+
+    if hasattr(value, 'to_dict'):
+        return(value.to_dict())
+
+    raise TypeError(f'{type(value).__name__} cannot be sent')
+
+
+def api_encode_multipart(params: dict) -> tuple:
+
+    boundary = uuid.uuid4().hex
+    parts = []
+
+    for key, value in params.items():
+        if isinstance(value, io.IOBase):
+            filename = getattr(value, 'name', key)
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'.encode() + value.read() + b'\r\n')
+
+        elif isinstance(value, bytes):
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"; filename="{key}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'.encode() + value + b'\r\n')
+
+        else:
+            if hasattr(value, 'to_json'):
+                value = value.to_json()
+            elif isinstance(value, (bool, list, dict)):
+                value = json.dumps(value)
+
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+
+    parts.append(f'--{boundary}--\r\n'.encode())
+
+    return(b''.join(parts), f'multipart/form-data; boundary={boundary}')
+
+
+async def api_request(bot: AsyncBot, path: str, body: bytes, content_type: str) -> tuple:
+
+    request = (f'POST {path} HTTP/1.1\r\nHost: {bot.host}\r\nContent-Type: {content_type}\r\n'
+               f'Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n'.encode() + body)
+
+    async with bot.connection_slots:
+        connection = api_get_idle_connection(bot)
+
+        response = None
+        if connection is not None:
+            response = await api_exchange(connection, request, is_reused=True)
+
+        # The server closed the idle connection, the request is sent once more on a new one
+        if response is None:
+            connection = await asyncio.open_connection(bot.host, bot.port, ssl=bot.ssl)
+            response = await api_exchange(connection, request, is_reused=False)
+
+        status, headers, response_body = response
+
+        reader, writer = connection
+        if headers.get('connection', '').lower() == 'close':
+            writer.close()
+        else:
+            bot.idle_connections.append((reader, writer, asyncio.get_running_loop().time()))
+
+    return(status, response_body)
+
+
+def api_get_idle_connection(bot: AsyncBot) -> tuple:
+
+    now = asyncio.get_running_loop().time()
+
+    # Servers and proxies close keep-alive connections that are idle for a while
+    idle_connections = []
+    for reader, writer, idle_since in bot.idle_connections:
+        if now - idle_since < bot.settings['idle_timeout'] and not reader.at_eof():
+            idle_connections.append((reader, writer, idle_since))
+        else:
+            writer.close()
+
+    bot.idle_connections = idle_connections
+
+    if not idle_connections:
+        return(None)
+
+    reader, writer, _ = idle_connections.pop()
+
+    return(reader, writer)
+
+
+async def api_exchange(connection: tuple, request: bytes, is_reused: bool) -> tuple:
+
+    reader, writer = connection
+
+    try:
+        try:
+            writer.write(request)
+            await writer.drain()
+
+            status, headers = await api_read_head(reader)
+
+        except (ConnectionError, asyncio.IncompleteReadError) as err:
+            # Closed before any byte of a response, the request was not processed
+            if is_reused and not getattr(err, 'partial', b''):
+                writer.close()
+                return(None)
+            raise
+
+        response_body = await api_read_body(reader, headers)
+
+    except BaseException:
+        writer.close()
+        raise
+
+    return(status, headers, response_body)
+
+
+async def api_read_head(reader: asyncio.StreamReader) -> tuple:
+
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    return(status, headers)
+
+
+async def api_read_body(reader: asyncio.StreamReader, headers: dict) -> bytes:
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            if size == 0:
+                await reader.readuntil(b'\r\n')
+                return(b''.join(chunks))
+
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    return(await reader.readexactly(int(headers.get('content-length', 0))))
+
+
+def api_get_result(status: int, response_body: bytes):
+
+    # Same mapping of API errors as the requests of python-telegram-bot
+    try:
+        response = json.loads(response_body.decode('utf-8'))
+
+    except ValueError:
+        raise NetworkError(f'Invalid server response ({status})')
+
+    if response.get('ok'):
+        return(response['result'])
+
+    description = response.get('description', 'Unknown HTTPError')
+    parameters = response.get('parameters') or {}
+
+    if 'migrate_to_chat_id' in parameters:
+        raise ChatMigrated(parameters['migrate_to_chat_id'])
+    if 'retry_after' in parameters:
+        raise RetryAfter(parameters['retry_after'])
+    if status in (401, 403):
+        raise Unauthorized(description)
+    if status == 400:
+        raise BadRequest(description)
+    if status == 404:
+        raise InvalidToken()
+    if status == 409:
+        raise Conflict(description)
+    if status == 502:
+        raise NetworkError('Bad Gateway')
+
+    raise NetworkError(f'{description} ({status})')
+
+
+my_logger = logging.getLogger('async_engine')
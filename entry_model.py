@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import re
+import sys
+import logging
+
+# Languages of the texts, the position is the index into the text tuples
+LANGUAGES = ('en', 'de')
+LANGUAGE_INDEX = {language: index for index, language in enumerate(LANGUAGES)}
+
+YOUTUBE_URL = 'https://www.youtube.com/watch?v='
+
+# Dates of the feed, compared and sorted as text
+DATE_FORMAT = re.compile(r'\d{4}-\d{2}-\d{2}$')
+
+
+class BlogEntry:
+
+    __slots__ = ('date_text', 'kind', 'media_type', 'permalink',
+                 'title', 'text', 'media_url', 'media_caption')
+
+    def __init__(self, date_text: str, kind: str, media_type: str, permalink: str,
+                 title: tuple, text: tuple, media_url: tuple, media_caption: tuple):
+
+        self.date_text = date_text
+        self.kind = kind
+        self.media_type = media_type
+        self.permalink = permalink
+        self.title = title
+        self.text = text
+        self.media_url = media_url
+        self.media_caption = media_caption
+
+    def __repr__(self) -> str:
+
+        return(f'BlogEntry({self.date_text}, {self.kind}, {self.media_type}, {self.permalink})')
+
+
+def entry_check(blog_entry: dict):
+
+    # Date and kind place the entry in the calendars, everything else may be missing
+    date_text = blog_entry['date']
+    if not isinstance(date_text, str) or not DATE_FORMAT.match(date_text):
+        raise ValueError(f'invalid date {date_text!r}')
+
+    if not isinstance(blog_entry['kind'], str) or not blog_entry['kind']:
+        raise ValueError(f'invalid kind {blog_entry["kind"]!r}')
+
+
+def entry_is_valid(blog_entry: dict) -> bool:
+
+    try:
+        entry_check(blog_entry)
+        return(True)
+
+    except (KeyError, TypeError, ValueError) as err:
+        my_logger.warning('Blog entry skipped: %r', err)
+        return(False)
+
+
+def entry_create(blog_entry: dict) -> BlogEntry:
+
+    entry_check(blog_entry)
+
+    date_text = blog_entry['date']
+    kind = sys.intern(blog_entry['kind'])
+
+    # Only mosaic entries carry media
+    media_type = ''
+    media_url = ('',) * len(LANGUAGES)
+    media_caption = ('',) * len(LANGUAGES)
+
+    if kind == 'mosaic':
+        media_type = sys.intern(str(blog_entry.get('media_type', '')).lower())
+
+        if media_type == 'image':
+            media_url = (entry_get_field(blog_entry.get('image'), 'url'),) * len(LANGUAGES)
+            media_caption = (entry_get_field(blog_entry.get('image'), 'caption'),) * len(LANGUAGES)
+
+        elif media_type == 'video':
+            media_url = tuple(entry_get_field(blog_entry.get(f'video_{language}'), 'url')
+                              for language in LANGUAGES)
+            media_caption = tuple(entry_get_field(blog_entry.get(f'video_{language}'), 'title')
+                                  for language in LANGUAGES)
+
+        elif media_type == 'youtube' and blog_entry.get('youtube_de'):
+            media_url = (f'{YOUTUBE_URL}{blog_entry["youtube_de"]}',) * len(LANGUAGES)
+
+    entry = BlogEntry(
+        date_text=date_text,
+        kind=kind,
+        media_type=media_type,
+        permalink=str(blog_entry.get('permalink') or ''),
+        title=tuple(str(blog_entry.get(f'title_{language}') or '') for language in LANGUAGES),
+        text=tuple(str(blog_entry.get(f'text_{language}') or '') for language in LANGUAGES),
+        media_url=media_url,
+        media_caption=media_caption)
+
+    return(entry)
+
+
+def entry_get_field(media: dict, field: str) -> str:
+
+    if not isinstance(media, dict):
+        return('')
+
+    return(str(media.get(field) or ''))
+
+
+def entry_create_all(blog: list) -> list:
+
+    entries = []
+
+    # A malformed entry is left out instead of failing the whole snapshot
+    for blog_entry in blog:
+        try:
+            entries.append(entry_create(blog_entry))
+
+        except (KeyError, TypeError, ValueError, AttributeError) as err:
+            my_logger.warning('Blog entry skipped: %r', err)
+
+    return(entries)
+
+
+my_logger = logging.getLogger('entry_model')
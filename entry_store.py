@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import sqlite3
+import threading
+import logging
+
+import entry_model
+
+FILE_TYPE = 'sqlite'
+
+STORE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS entries (
+        position INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        media_type TEXT NOT NULL,
+        permalink TEXT NOT NULL,
+        entry TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS entries_date ON entries (date, position);
+    CREATE INDEX IF NOT EXISTS entries_kind ON entries (kind, date);
+    CREATE INDEX IF NOT EXISTS entries_media_type ON entries (media_type);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+'''
+
+# Read connections of the bot, one per thread
+store_connections = threading.local()
+
+
+def main():
+
+    import run_mosaic_bot as mosaic
+
+    config = mosaic.get_config(os.path.abspath(os.path.dirname(__file__)))
+    data_filename = f'{config["data_path"]}/{config["data_file"]}.json'
+
+    my_logger.info('Import %s into the entry store', data_filename)
+    with open(data_filename) as data_file:
+        store_write(config, json.load(data_file)['blog'])
+
+
+def store_get_filename(config: dict) -> str:
+
+    return(config.get('store_file', f'{config["data_path"]}/{config["data_file"]}.{FILE_TYPE}'))
+
+
+def store_write(config: dict, blog: list) -> int:
+
+    store_filename = store_get_filename(config)
+
+    # Entries the bot would skip are not written, so one of them cannot fail the import
+    blog = [entry for entry in blog if entry_model.entry_is_valid(entry)]
+
+    connection = sqlite3.connect(store_filename)
+    try:
+        # WAL lets the bots keep reading while the downloader writes
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(STORE_SCHEMA)
+
+        with connection:
+            connection.execute('DELETE FROM entries')
+            connection.executemany(
+                'INSERT INTO entries (position, date, kind, media_type, permalink, entry) VALUES (?, ?, ?, ?, ?, ?)',
+                ((position, entry['date'], entry['kind'], str(entry.get('media_type', '')).lower(),
+                  entry.get('permalink', ''), json.dumps(entry))
+                 for position, entry in enumerate(blog)))
+            connection.execute(
+                "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+                "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+
+        generation = store_get_generation(connection)
+        my_logger.info('%s entries written to %s, generation %s', len(blog), store_filename, generation)
+
+        return(generation)
+
+    finally:
+        connection.close()
+
+
+def store_connect(config: dict) -> sqlite3.Connection:
+
+    store_filename = store_get_filename(config)
+
+    connection = getattr(store_connections, 'connection', None)
+    if connection is not None and store_connections.filename == store_filename:
+        return(connection)
+
+    if connection is not None:
+        connection.close()
+
+    connection = sqlite3.connect(f'file:{store_filename}?mode=ro', uri=True)
+    store_connections.connection = connection
+    store_connections.filename = store_filename
+
+    return(connection)
+
+
+def store_get_generation(connection: sqlite3.Connection) -> int:
+
+    row = connection.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+
+    return(row[0] if row else 0)
+
+
+def store_get_entry_by_date(connection: sqlite3.Connection, date: str) -> dict:
+
+    row = connection.execute(
+        'SELECT entry FROM entries WHERE date = ? ORDER BY position LIMIT 1', (date,)).fetchone()
+
+    return(json.loads(row[0]) if row else None)
+
+
+def store_get_entry_latest(connection: sqlite3.Connection, date: str) -> dict:
+
+    row = connection.execute(
+        'SELECT entry FROM entries WHERE date <= ? ORDER BY date DESC, position LIMIT 1', (date,)).fetchone()
+
+    return(json.loads(row[0]) if row else None)
+
+
+def store_get_blog(connection: sqlite3.Connection) -> list:
+
+    return([json.loads(row[0]) for row in connection.execute('SELECT entry FROM entries ORDER BY position')])
+
+
+def store_get_dates(connection: sqlite3.Connection) -> list:
+
+    return(connection.execute('SELECT kind, date FROM entries ORDER BY kind, date').fetchall())
+
+
+my_logger = logging.getLogger('entry_store')
+
+if __name__ == '__main__':
+    my_logger.level = logging.INFO
+    my_logger.addHandler(logging.StreamHandler(sys.stdout))
+    main()
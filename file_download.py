@@ -4,109 +4,513 @@ import requests
 import json
 import datetime
 import os, sys
+import shutil
+import re
+import hashlib
+import gzip
+import glob
+import random
+import signal
+import threading
 import logging
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import run_mosaic_bot as mosaic
+import entry_store
+import log_pipeline
 
 FILE_TYPE = 'json'
 
+# Size of the chunks the response is streamed with
+CHUNK_SIZE = 65536
+
+# Characters that change the structure of a JSON document
+JSON_STRUCTURE = re.compile(rb'["\\{}\[\]]')
+
+# Defaults for the http settings in config.json, timeouts in seconds
+HTTP_DEFAULTS = {
+    'connect_timeout': 10,
+    'read_timeout': 60,
+    'retries': 3,
+    'backoff_factor': 1.0,
+    'retry_status': [500, 502, 503, 504],
+    'pool_size': 4
+}
+
+# Defaults for the scheduler in config.json, times in seconds
+SCHEDULE_DEFAULTS = {
+    'interval': 3600,
+    'jitter': 300
+}
+
+# Number of days dated snapshots and changes are kept
+RETENTION_DAYS = 4
+
+# Shared session, keeps the connections to the server alive
+http_session = None
+
 def main ():
 
     config = mosaic.get_config(os.path.abspath(os.path.dirname(__file__)))
-    my_logger.info(f'Path to the data file: {config["data_path"]}')
-    my_logger.info(f'Name of the data file: {config["data_file"]}')
+    my_logger.info('Path to the data file: %s', config["data_path"])
+    my_logger.info('Name of the data file: %s', config["data_file"])
+
+    if '--daemon' in sys.argv[1:]:
+        data_schedule(config)
+
+    else:
+        try:
+            data_update(config)
+
+        except Exception:
+            sys.exit()
+
+def data_schedule(config: dict):
+
+    settings = dict(SCHEDULE_DEFAULTS)
+    settings.update(config.get('schedule', {}))
+
+    stop_event = threading.Event()
+
+    def handler_stop(signum: int, frame):
+        my_logger.info('Signal %s received, stopping the scheduler', signum)
+        stop_event.set()
+
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(stop_signal, handler_stop)
+
+    my_logger.info('Scheduler started: %s', settings)
+    while not stop_event.is_set():
+        try:
+            data_update(config)
+
+        except Exception as err:
+            my_logger.error('Update failed, retrying with the next run: %s', err)
 
-    temp_filename = data_download(config)
+        delay = settings['interval'] + random.uniform(0, settings['jitter'])
+        my_logger.info('Next update in %.0f seconds', delay)
+        stop_event.wait(delay)
 
-    data_activate (temp_filename, config)
+def data_update(config: dict) -> bool:
 
-def data_download(config: dict) -> str:
+    state = data_read_state(config)
+
+    download = data_download(config, state)
+    if download is None:
+        my_logger.info('Data not modified on the server')
+        return(False)
+
+    state['etag'] = download['etag']
+    state['last_modified'] = download['last_modified']
+
+    if download['sha256'] == data_get_active_hash(config, state):
+        my_logger.info('Downloaded data is unchanged, keeping the active file')
+        os.remove(download['filename'])
+        data_write_state(config, state)
+        return(False)
+
+    # The active data is reduced to digests before the new data is parsed, only one feed is held at a time
+    active_digests = data_read_digests(config)
+    new_blog = data_read_blog(download['filename'])
+
+    data_ingest(active_digests, new_blog, config)
+    data_archive(download['filename'])
+
+    # The store is written first, if it fails neither the state nor the bot see the new data
+    if config.get('storage') == 'sqlite':
+        entry_store.store_write(config, new_blog)
+
+    if not data_activate(download['filename'], config):
+        return(False)
+
+    state['sha256'] = download['sha256']
+    data_write_state(config, state)
+
+    data_apply_retention(config)
+
+    data_notify_bot(config)
+
+    return(True)
+
+def data_download(config: dict, state: dict = None) -> dict:
+
+    state = state or {}
+    data_filename = f'{config["data_path"]}/{config["data_file"]}_{datetime.date.today()}.{FILE_TYPE}'
+    part_filename = f'{data_filename}.part'
 
     try:
 
-        data_filename = f'{config["data_path"]}/{config["data_file"]}_{datetime.date.today()}.{FILE_TYPE}'
+        request_headers = {}
+        if state.get('etag'):
+            request_headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            request_headers['If-Modified-Since'] = state['last_modified']
+
+        my_logger.info('Start data download ')
+        my_logger.debug('Request url: %s', config["mosaic_url"])
+        with http_get(config, config["mosaic_url"], headers=request_headers) as web_response:
+            if web_response.status_code == 304:
+                return(None)
+
+            web_response.raise_for_status()
+            my_logger.debug('Request successfull: %s', web_response)
 
-        my_logger.info(f'Start data download ')
-        with open(data_filename, 'w') as data_file:
+            with open(part_filename, 'wb') as data_file:
+                my_logger.debug('Data file %s successfull opened', part_filename)
 
-            my_logger.debug(f'Data file {data_filename} successfull opened')
+                validation = data_create_validation()
+                content_hash = hashlib.sha256()
+                for chunk in web_response.iter_content(chunk_size=CHUNK_SIZE):
+                    data_validate_chunk(validation, chunk)
+                    content_hash.update(chunk)
+                    data_file.write(chunk)
 
-            my_logger.debug(f'Request url: {config["mosaic_url"]}')
-            web_response = requests.request('get', config["mosaic_url"])
-            json_data = web_response.json()
-            my_logger.debug(f'Request successfull: {web_response}')
+                if not data_validation_complete(validation):
+                    raise ValueError('Downloaded JSON data is incomplete')
 
-            json.dump(json_data, data_file)
-            my_logger.debug(f'File: {data_filename} successfull written')
-            data_file.close()
+                data_file.flush()
+                os.fsync(data_file.fileno())
 
-            my_logger.info(f'Data download successfull')
-            return(data_filename)
+            download = {
+                'filename': data_filename,
+                'sha256': content_hash.hexdigest(),
+                'etag': web_response.headers.get('ETag'),
+                'last_modified': web_response.headers.get('Last-Modified')
+            }
 
-    except (requests.ConnectionError, requests.HTTPError, requests.Timeout) as err:
-        my_logger.error(f'The HTTP requests has raised an error: {err}')
-        sys.exit()
+        os.replace(part_filename, data_filename)
+        my_logger.debug('File: %s successfull written', data_filename)
+
+        my_logger.info('Data download successfull')
+        return(download)
+
+    except requests.RequestException as err:
+        my_logger.error('The HTTP requests has raised an error: %s', err)
+        data_remove_part(part_filename)
+        raise
 
     except OSError as err:
-        my_logger.error(f'An OS error occurred: {err}')
-        sys.exit()
+        my_logger.error('An OS error occurred: %s', err)
+        data_remove_part(part_filename)
+        raise
+
+    except Exception as err:
+        my_logger.error('An error occurred: %s', err)
+        data_remove_part(part_filename)
+        raise
+
+def data_ingest(active_digests: dict, new_blog: list, config: dict) -> dict:
+
+    my_logger.info('Comparing the new data with the active data')
+    new_entries = data_index_entries(new_blog)
+
+    changes = {
+        'date': str(datetime.date.today()),
+        'added': [],
+        'changed': [],
+        'removed': []
+    }
+
+    for key, entry in new_entries.items():
+        if key not in active_digests:
+            changes['added'].append(entry)
+        elif data_get_entry_digest(entry) != active_digests[key]:
+            changes['changed'].append(entry)
+
+    for key in active_digests:
+        if key not in new_entries:
+            changes['removed'].append({'date': key[0], 'permalink': key[1]})
+
+    my_logger.info('%s entries added, %s changed, %s removed',
+                   len(changes['added']), len(changes['changed']), len(changes['removed']))
+
+    if changes['added'] or changes['changed'] or changes['removed']:
+        with open(data_get_changes_filename(config), 'a') as changes_file:
+            changes_file.write(f'{json.dumps(changes)}\n')
+
+    return(changes)
+
+def data_read_blog(data_filename: str) -> list:
+
+    with open(data_filename) as data_file:
+        return(json.load(data_file)['blog'])
+
+def data_read_digests(config: dict) -> dict:
+
+    data_filename = f'{config["data_path"]}/{config["data_file"]}.{FILE_TYPE}'
+    if not os.path.exists(data_filename):
+        return({})
+
+    return({key: data_get_entry_digest(entry)
+            for key, entry in data_index_entries(data_read_blog(data_filename)).items()})
+
+def data_index_entries(blog: list) -> dict:
+
+    return({(entry.get('date'), entry.get('permalink', '')): entry
+            for entry in blog if isinstance(entry, dict)})
+
+def data_get_entry_digest(entry: dict) -> bytes:
+
+    return(hashlib.sha256(json.dumps(entry, sort_keys=True).encode('utf-8')).digest())
+
+def data_get_changes_filename(config: dict) -> str:
+
+    return(f'{config["data_path"]}/{config["data_file"]}.changes.{FILE_TYPE}l')
+
+def data_archive(today_filename: str):
+
+    with open(today_filename, 'rb') as data_file, gzip.open(f'{today_filename}.gz.tmp', 'wb') as archive_file:
+        shutil.copyfileobj(data_file, archive_file, CHUNK_SIZE)
+
+    os.replace(f'{today_filename}.gz.tmp', f'{today_filename}.gz')
+    my_logger.info('Dated snapshot archived to %s.gz', today_filename)
+
+def data_apply_retention(config: dict):
+
+    retention_days = config.get('retention_days', RETENTION_DAYS)
+    oldest_date = str(datetime.date.today() - datetime.timedelta(days=retention_days - 1))
+
+    # The date is part of the archive name: <data_file>_<yyyy-mm-dd>.json.gz
+    prefix_length = len(f'{config["data_path"]}/{config["data_file"]}_')
+    for archive_filename in glob.glob(f'{config["data_path"]}/{config["data_file"]}_*.{FILE_TYPE}.gz'):
+        if archive_filename[prefix_length:prefix_length + 10] < oldest_date:
+            os.remove(archive_filename)
+            my_logger.info('Archive %s removed', archive_filename)
+
+    changes_filename = data_get_changes_filename(config)
+    if os.path.exists(changes_filename):
+        with open(changes_filename) as changes_file:
+            kept_lines = [line for line in changes_file if json.loads(line)['date'] >= oldest_date]
+
+        with open(f'{changes_filename}.tmp', 'w') as changes_file:
+            changes_file.writelines(kept_lines)
+
+        os.replace(f'{changes_filename}.tmp', changes_filename)
 
-    except:
-        my_logger.error('An error occurred')
-        sys.exit()
+def data_get_state_filename(config: dict) -> str:
+
+    return(f'{config["data_path"]}/{config["data_file"]}.state.{FILE_TYPE}')
+
+def data_read_state(config: dict) -> dict:
+
+    try:
+        with open(data_get_state_filename(config)) as state_file:
+            return(json.load(state_file))
+
+    except (OSError, ValueError) as err:
+        my_logger.debug('No download state available: %s', err)
+        return({})
+
+def data_write_state(config: dict, state: dict):
+
+    state_filename = data_get_state_filename(config)
+
+    with open(f'{state_filename}.tmp', 'w') as state_file:
+        json.dump(state, state_file)
+
+    os.replace(f'{state_filename}.tmp', state_filename)
+    my_logger.debug('Download state written: %s', state)
+
+def data_get_active_hash(config: dict, state: dict) -> str:
+
+    if state.get('sha256'):
+        return(state['sha256'])
+
+    data_filename = f'{config["data_path"]}/{config["data_file"]}.{FILE_TYPE}'
+    if not os.path.exists(data_filename):
+        return(None)
+
+    content_hash = hashlib.sha256()
+    with open(data_filename, 'rb') as data_file:
+        for chunk in iter(lambda: data_file.read(CHUNK_SIZE), b''):
+            content_hash.update(chunk)
+
+    return(content_hash.hexdigest())
+
+def data_notify_bot(config: dict):
+
+    try:
+        with open(mosaic.get_pid_filename(config)) as pid_file:
+            bot_pid = int(pid_file.read().strip())
+
+        # The pid of a bot that did not remove its file may belong to another process by now
+        if not data_is_bot_process(bot_pid):
+            my_logger.warning('Bot not notified, process %s is no MOSAIC bot', bot_pid)
+            return
+
+        os.kill(bot_pid, signal.SIGUSR1)
+        my_logger.info('Bot %s notified about the new data', bot_pid)
+
+    except (OSError, ValueError) as err:
+        my_logger.warning('Bot could not be notified: %s', err)
+
+def data_is_bot_process(bot_pid: int) -> bool:
+
+    # Without /proc only the existence of the process can be checked
+    if not os.path.isdir('/proc'):
+        os.kill(bot_pid, 0)
+        return(True)
+
+    try:
+        with open(f'/proc/{bot_pid}/cmdline', 'rb') as cmdline_file:
+            return(b'run_mosaic_bot' in cmdline_file.read())
+
+    except OSError:
+        return(False)
+
+def http_get_settings(config: dict) -> dict:
+
+    settings = dict(HTTP_DEFAULTS)
+    settings.update(config.get('http', {}))
+
+    return(settings)
+
+def http_get_session(config: dict) -> requests.Session:
+
+    global http_session
+
+    if http_session is None:
+        settings = http_get_settings(config)
+
+        # The last response is returned after the retries, raise_for_status reports it
+        retry = Retry(total=settings['retries'], connect=settings['retries'], read=settings['retries'],
+                      status=settings['retries'], backoff_factor=settings['backoff_factor'],
+                      status_forcelist=settings['retry_status'], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=settings['pool_size'],
+                              pool_maxsize=settings['pool_size'], max_retries=retry)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+
+        http_session = session
+        my_logger.debug('HTTP session created: %s', settings)
+
+    return(http_session)
+
+def http_get(config: dict, url: str, **kwargs) -> requests.Response:
+
+    settings = http_get_settings(config)
+
+    return(http_get_session(config).get(
+        url, stream=True, timeout=(settings['connect_timeout'], settings['read_timeout']), **kwargs))
+
+def data_remove_part(part_filename: str):
+
+    if os.path.exists(part_filename):
+        os.remove(part_filename)
+        my_logger.debug('Partial file %s removed', part_filename)
+
+def data_create_validation() -> dict:
+
+    validation = {
+        'depth': 0,
+        'started': False,
+        'closed': False,
+        'in_string': False,
+        'skip_position': -1
+    }
+
+    return(validation)
+
+def data_validate_chunk(validation: dict, chunk: bytes):
+
+    # Only the structure is checked, the bot parses the content
+    if not validation['started']:
+        stripped = chunk.lstrip()
+        if not stripped:
+            return
+        if stripped[:1] != b'{':
+            raise ValueError('Downloaded data is no JSON object')
+        validation['started'] = True
+
+    skip_position = validation['skip_position']
+
+    for match in JSON_STRUCTURE.finditer(chunk):
+        position = match.start()
+        character = match.group()
+
+        if position == skip_position:
+            continue
+
+        if validation['closed']:
+            raise ValueError('Data after the end of the JSON object')
+
+        if validation['in_string']:
+            if character == b'\\':
+                skip_position = position + 1
+            elif character == b'"':
+                validation['in_string'] = False
+
+        elif character == b'"':
+            validation['in_string'] = True
+
+        elif character in (b'{', b'['):
+            validation['depth'] += 1
+
+        else:
+            validation['depth'] -= 1
+            if validation['depth'] < 0:
+                raise ValueError('Unbalanced JSON data')
+            if validation['depth'] == 0:
+                validation['closed'] = True
+
+    # An escape at the end of the chunk skips the first byte of the next one
+    validation['skip_position'] = 0 if skip_position == len(chunk) else -1
+
+def data_validation_complete(validation: dict) -> bool:
+
+    return(validation['closed'] and not validation['in_string'])
 
 def data_activate(today_filename: str, config: dict) -> bool():
 
-    my_logger.info(f'Start activating latest data')
+    my_logger.info('Start activating latest data')
 
     try:
         bck_filename = f'{config["data_path"]}/{config["data_file"]}.bak'
-        my_logger.debug(f'Backup file: {bck_filename}')
+        my_logger.debug('Backup file: %s', bck_filename)
         tmp_filename = f'{config["data_path"]}/data.tmp'
-        my_logger.debug(f'Temporary file: {tmp_filename}')
+        my_logger.debug('Temporary file: %s', tmp_filename)
         data_filename = f'{config["data_path"]}/{config["data_file"]}.{FILE_TYPE}'
-        my_logger.debug(f'Data file: {data_filename}')
+        my_logger.debug('Data file: %s', data_filename)
 
         if os.path.exists(tmp_filename):
             os.remove(tmp_filename)
-            my_logger.debug(f'Existing temporary file successfull deleted')
+            my_logger.debug('Existing temporary file successfull deleted')
 
-        if os.path.exists(bck_filename):
-            os.rename(bck_filename, tmp_filename)
-            my_logger.debug(f'Temporary copy of backup file created')
+        # Keep the data file in place, the bot reads it at any time
+        if os.path.exists(data_filename):
+            shutil.copy2(data_filename, tmp_filename)
+            os.replace(tmp_filename, bck_filename)
+            my_logger.info('Data file backed up')
 
-        os.rename(data_filename, bck_filename)
-        my_logger.info('Data file backed up')
-
-        os.rename(today_filename, data_filename)
+        os.replace(today_filename, data_filename)
         my_logger.info('New file moved to data file')
 
-        if os.path.exists(tmp_filename):
-            os.remove(tmp_filename)
-            my_logger.debug(f'Temporary file: {tmp_filename} successfull removed')
-
-        my_logger.info(f'Activation of data successfull')
+        my_logger.info('Activation of data successfull')
         return(True)
 
     except OSError as err:
 
-        my_logger.error(f'An error occurred: {err}')
+        my_logger.error('An error occurred: %s', err)
         if not(os.path.exists(data_filename)):
-            my_logger.info(f'Data file missing. Try to restore')
+            my_logger.info('Data file missing. Try to restore')
             if os.path.exists(bck_filename):
                 os.rename(bck_filename, data_filename)
-                my_logger.warning(f'The data file is restored')
+                my_logger.warning('The data file is restored')
                 return(True)
 
             else:
-                my_logger.error(f'Data file could not restored. Terminate programm')
+                my_logger.error('Data file could not restored. Terminate programm')
                 sys.exit()
 
-my_logger = logging.getLogger()
-my_logger.level = logging.DEBUG
-
-logfile_handler = logging.StreamHandler(sys.stdout)
-logfile_handler.setFormatter(logging.Formatter('%(asctime)s - %(funcName)s - %(message)s'))
-my_logger.addHandler(logfile_handler)
+my_logger = logging.getLogger('file_download')
 
 if __name__ == '__main__':
+    script_path = os.path.abspath(os.path.dirname(__file__))
+    log_config = mosaic.get_config(script_path)
+    log_pipeline.log_start(log_config, [
+        logging.StreamHandler(sys.stdout),
+        log_pipeline.log_create_file_handler(log_config, f'{mosaic.get_log_path()}/{mosaic.LOG_FILE}')], 'DEBUG')
     main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Defaults for the logging settings in config.json, modules maps logger names to levels
+LOGGING_DEFAULTS = {
+    'level': 'WARNING',
+    'modules': {},
+    'max_bytes': 1024000,
+    'backup_count': 7,
+    'format': '%(asctime)s - %(funcName)s - %(message)s'
+}
+
+# The listener writes the queued records in its own thread
+log_state = {
+    'listener': None,
+    'queue_handler': None,
+    'modules': ()
+}
+
+
+def log_get_settings(config: dict) -> dict:
+
+    settings = dict(LOGGING_DEFAULTS)
+    settings.update(config.get('logging', {}))
+
+    return(settings)
+
+
+def log_start(config: dict, handlers: list, level: str = None):
+
+    settings = log_get_settings(config)
+    root_logger = logging.getLogger()
+
+    log_stop()
+
+    formatter = logging.Formatter(settings['format'])
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # Request threads only put records on the queue, the files are written by the listener
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(level or settings['level'])
+    log_apply_levels(config)
+
+    log_state['listener'] = listener
+    log_state['queue_handler'] = queue_handler
+    listener.start()
+
+
+def log_apply_levels(config: dict):
+
+    settings = log_get_settings(config)
+
+    # Modules dropped from the configuration follow the root level again
+    for name in log_state['modules']:
+        if name not in settings['modules']:
+            logging.getLogger(name).setLevel(logging.NOTSET)
+
+    for name, level in settings['modules'].items():
+        logging.getLogger(name).setLevel(level)
+
+    log_state['modules'] = tuple(settings['modules'])
+
+
+def log_stop():
+
+    listener = log_state['listener']
+    if listener is None:
+        return
+
+    # Pending records are written before the handlers are closed
+    logging.getLogger().removeHandler(log_state['queue_handler'])
+    listener.stop()
+
+    for handler in listener.handlers:
+        handler.close()
+
+    log_state['listener'] = None
+    log_state['queue_handler'] = None
+
+
+def log_create_file_handler(config: dict, filename: str) -> RotatingFileHandler:
+
+    settings = log_get_settings(config)
+
+    return(RotatingFileHandler(filename, maxBytes=settings['max_bytes'], backupCount=settings['backup_count']))
+
+
+atexit.register(log_stop)
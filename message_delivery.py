@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+
+import time
+import heapq
+import asyncio
+import inspect
+import threading
+import collections
+import logging
+from concurrent.futures import Future
+
+from telegram.error import BadRequest, RetryAfter, TimedOut, NetworkError
+
+import metrics_exporter
+import update_profiler
+
+# Defaults for the delivery settings in config.json, rates are calls per second
+DELIVERY_DEFAULTS = {
+    'workers': 4,
+    'global_rate': 30,
+    'global_burst': 30,
+    'chat_rate': 1,
+    'chat_burst': 3,
+    'max_retries': 5,
+    'backoff': 0.5,
+    'max_backoff': 30
+}
+
+# API methods of the helpers that wrap a Bot API call
+DELIVERY_METHODS = {
+    'media_deliver_photo': 'sendPhoto',
+    'media_deliver_photo_async': 'sendPhoto'
+}
+
+# State of the outbound queue, guarded by the condition
+delivery = {
+    'settings': None,
+    'condition': threading.Condition(),
+    'chats': {},
+    'ready': collections.deque(),
+    'waiting': [],
+    'exempt': collections.deque(),
+    'global_bucket': None,
+    'chat_buckets': {},
+    'workers': [],
+    'loop': None
+}
+
+
+def delivery_start(config: dict):
+
+    settings = dict(DELIVERY_DEFAULTS)
+    settings.update(config.get('delivery', {}))
+
+    with delivery['condition']:
+        if delivery['workers']:
+            my_logger.warning('Delivery already running')
+            return
+
+        delivery['settings'] = settings
+        delivery['global_bucket'] = delivery_create_bucket(
+            settings['global_rate'], settings['global_burst'])
+
+        for number in range(settings['workers']):
+            worker = threading.Thread(
+                target=delivery_worker, name=f'delivery_{number}', daemon=True)
+            worker.start()
+            delivery['workers'].append(worker)
+
+    my_logger.info('Delivery started with %s workers', settings["workers"])
+
+
+def delivery_start_async(config: dict, loop: asyncio.AbstractEventLoop):
+
+    settings = dict(DELIVERY_DEFAULTS)
+    settings.update(config.get('delivery', {}))
+
+    # The jobs are coroutines on the loop instead of calls in worker threads
+    with delivery['condition']:
+        delivery['settings'] = settings
+        delivery['global_bucket'] = delivery_create_bucket(
+            settings['global_rate'], settings['global_burst'])
+        delivery['loop'] = loop
+
+    my_logger.info('Delivery started on the event loop')
+
+
+def delivery_submit(target_chat: int, function, *args, **kwargs) -> Future:
+
+    job = {
+        'function': function,
+        'args': args,
+        'kwargs': kwargs,
+        'future': Future()
+    }
+
+    if delivery['loop'] is not None:
+        delivery_submit_async(target_chat, job)
+        return(job['future'])
+
+    # Without running workers the call is made right away, e.g. in scripts
+    if not delivery['workers']:
+        delivery_execute(target_chat, job, DELIVERY_DEFAULTS)
+        return(job['future'])
+
+    with delivery['condition']:
+        chat_jobs = delivery['chats'].get(target_chat)
+
+        if chat_jobs is None:
+            delivery['chats'][target_chat] = collections.deque([job])
+            delivery['ready'].append(target_chat)
+            delivery['condition'].notify()
+
+        else:
+            # A worker is already serving this chat and keeps the order
+            chat_jobs.append(job)
+
+    return(job['future'])
+
+
+def delivery_submit_exempt(target_chat: int, function, *args, **kwargs) -> Future:
+
+    job = {
+        'function': function,
+        'args': args,
+        'kwargs': kwargs,
+        'future': Future()
+    }
+
+    # Calls that do not send a message, like answering a callback query, skip the budgets and the chat order
+    if delivery['loop'] is not None:
+        asyncio.run_coroutine_threadsafe(
+            delivery_execute_async(target_chat, job, delivery['settings']), delivery['loop'])
+        return(job['future'])
+
+    if not delivery['workers']:
+        delivery_execute(target_chat, job, DELIVERY_DEFAULTS)
+        return(job['future'])
+
+    with delivery['condition']:
+        delivery['exempt'].append((target_chat, job))
+        delivery['condition'].notify()
+
+    return(job['future'])
+
+
+def delivery_submit_async(chat_id: int, job: dict):
+
+    with delivery['condition']:
+        chat_jobs = delivery['chats'].get(chat_id)
+
+        if chat_jobs is None:
+            delivery['chats'][chat_id] = collections.deque([job])
+            asyncio.run_coroutine_threadsafe(delivery_serve_chat(chat_id), delivery['loop'])
+
+        else:
+            # The running coroutine of this chat keeps the order
+            chat_jobs.append(job)
+
+
+async def delivery_serve_chat(chat_id: int):
+
+    while True:
+        with delivery['condition']:
+            job = delivery['chats'][chat_id][0]
+            delay = delivery_reserve_budget(chat_id, time.monotonic())
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+            continue
+
+        await delivery_execute_async(chat_id, job, delivery['settings'])
+
+        with delivery['condition']:
+            chat_jobs = delivery['chats'][chat_id]
+            chat_jobs.popleft()
+
+            if not chat_jobs:
+                del delivery['chats'][chat_id]
+                return
+
+
+async def delivery_execute_async(chat_id: int, job: dict, settings: dict):
+
+    future = job['future']
+    method = delivery_get_method(job)
+
+    for attempt in range(settings['max_retries'] + 1):
+        started = time.perf_counter()
+        try:
+            result = job['function'](*job['args'], **job['kwargs'])
+            if inspect.isawaitable(result):
+                result = await result
+            metrics_exporter.metrics_observe('mosaic_api_seconds', (('method', method),), time.perf_counter() - started)
+
+            future.set_result(result)
+            return
+
+        except RetryAfter as err:
+            delivery_count_error(method, err)
+            my_logger.warning(
+                'Flood limit for chat %s, retry in %s seconds', chat_id, err.retry_after)
+            delivery_hold(err.retry_after)
+            await asyncio.sleep(err.retry_after)
+            last_error = err
+
+        except BadRequest as err:
+            delivery_count_error(method, err)
+            last_error = err
+            break
+
+        except (TimedOut, NetworkError) as err:
+            delivery_count_error(method, err)
+            delay = min(settings['backoff'] * 2 ** attempt, settings['max_backoff'])
+            my_logger.warning(
+                'Sending to chat %s failed: %s, retry in %s seconds', chat_id, err, delay)
+            await asyncio.sleep(delay)
+            last_error = err
+
+        except Exception as err:
+            delivery_count_error(method, err)
+            last_error = err
+            break
+
+    my_logger.error('Sending to chat %s failed: %s', chat_id, last_error)
+    future.set_exception(last_error)
+
+
+def delivery_get_method(job: dict) -> str:
+
+    function_name = getattr(job['function'], '__name__', 'call')
+
+    # Bot methods are named like the API methods in camel case
+    method = DELIVERY_METHODS.get(function_name)
+    if method is None:
+        name_parts = function_name.split('_')
+        method = name_parts[0] + ''.join(part.title() for part in name_parts[1:])
+
+    return(method)
+
+
+def delivery_count_error(method: str, err: Exception):
+
+    metrics_exporter.metrics_count(
+        'mosaic_api_errors_total', (('method', method), ('error', type(err).__name__)))
+
+
+def delivery_worker():
+
+    condition = delivery['condition']
+
+    while True:
+        with condition:
+            chat_id = delivery_take_ready_chat()
+            if chat_id is None:
+                job_chat, job = delivery['exempt'].popleft()
+            else:
+                job_chat, job = chat_id, delivery['chats'][chat_id][0]
+
+        # The API calls are part of an active profiling session, counted apart from the updates
+        if update_profiler.profiler_is_active():
+            update_profiler.profiler_run(delivery_execute, (job_chat, job, delivery['settings']), is_update=False)
+        else:
+            delivery_execute(job_chat, job, delivery['settings'])
+
+        if chat_id is None:
+            continue
+
+        with condition:
+            chat_jobs = delivery['chats'][chat_id]
+            chat_jobs.popleft()
+
+            if chat_jobs:
+                delivery['ready'].append(chat_id)
+                condition.notify()
+
+            else:
+                del delivery['chats'][chat_id]
+
+
+def delivery_take_ready_chat() -> int:
+
+    condition = delivery['condition']
+
+    # Called with the condition held, returns a chat whose budget is already taken
+    # or None for a call that is exempt from the budgets
+    while True:
+        if delivery['exempt']:
+            return(None)
+
+        now = time.monotonic()
+        while delivery['waiting'] and delivery['waiting'][0][0] <= now:
+            delivery['ready'].append(heapq.heappop(delivery['waiting'])[1])
+
+        timeout = delivery['waiting'][0][0] - now if delivery['waiting'] else None
+
+        if delivery['ready']:
+            chat_id = delivery['ready'].popleft()
+            delay = delivery_reserve_budget(chat_id, now)
+
+            if delay == 0:
+                # Another worker takes over waiting for the remaining chats
+                if delivery['ready'] or delivery['waiting'] or delivery['exempt']:
+                    condition.notify()
+                return(chat_id)
+
+            # The chat waits for its budget without holding a worker
+            heapq.heappush(delivery['waiting'], (now + delay, chat_id))
+            continue
+
+        condition.wait(timeout)
+
+
+def delivery_execute(chat_id: int, job: dict, settings: dict):
+
+    future = job['future']
+    method = delivery_get_method(job)
+
+    for attempt in range(settings['max_retries'] + 1):
+        started = time.perf_counter()
+        try:
+            result = job['function'](*job['args'], **job['kwargs'])
+            metrics_exporter.metrics_observe('mosaic_api_seconds', (('method', method),), time.perf_counter() - started)
+
+            future.set_result(result)
+            return
+
+        except RetryAfter as err:
+            delivery_count_error(method, err)
+            my_logger.warning(
+                'Flood limit for chat %s, retry in %s seconds', chat_id, err.retry_after)
+            delivery_hold(err.retry_after)
+            time.sleep(err.retry_after)
+            last_error = err
+
+        except BadRequest as err:
+            delivery_count_error(method, err)
+            last_error = err
+            break
+
+        except (TimedOut, NetworkError) as err:
+            delivery_count_error(method, err)
+            delay = min(settings['backoff'] * 2 ** attempt, settings['max_backoff'])
+            my_logger.warning(
+                'Sending to chat %s failed: %s, retry in %s seconds', chat_id, err, delay)
+            time.sleep(delay)
+            last_error = err
+
+        except Exception as err:
+            delivery_count_error(method, err)
+            last_error = err
+            break
+
+    my_logger.error('Sending to chat %s failed: %s', chat_id, last_error)
+    future.set_exception(last_error)
+
+
+def delivery_create_bucket(rate: float, burst: float) -> dict:
+
+    bucket = {
+        'rate': float(rate),
+        'burst': float(burst),
+        'tokens': float(burst),
+        'time': time.monotonic()
+    }
+
+    return(bucket)
+
+
+def delivery_refill(bucket: dict, now: float) -> float:
+
+    # Tokens may go negative after a flood limit, the delay is how long until one is earned
+    bucket['tokens'] = min(bucket['burst'], bucket['tokens'] + (now - bucket['time']) * bucket['rate'])
+    bucket['time'] = now
+
+    return(max(0.0, (1 - bucket['tokens']) / bucket['rate']))
+
+
+def delivery_reserve_budget(chat_id: int, now: float) -> float:
+
+    settings = delivery['settings']
+
+    chat_bucket = delivery['chat_buckets'].get(chat_id)
+    if chat_bucket is None:
+        chat_bucket = delivery_create_bucket(
+            settings['chat_rate'], settings['chat_burst'])
+        delivery['chat_buckets'][chat_id] = chat_bucket
+
+    global_bucket = delivery['global_bucket']
+
+    # Tokens are only taken when both budgets allow the call
+    delay = max(delivery_refill(global_bucket, now), delivery_refill(chat_bucket, now))
+    if delay == 0:
+        global_bucket['tokens'] -= 1
+        chat_bucket['tokens'] -= 1
+
+    delivery_forget_idle_chats(now)
+
+    return(delay)
+
+
+def delivery_forget_idle_chats(now: float):
+
+    settings = delivery['settings']
+
+    # Buckets refilled up to the burst carry no state anymore
+    if len(delivery['chat_buckets']) < 1000:
+        return
+
+    full_time = settings['chat_burst'] / settings['chat_rate']
+    for chat_id in list(delivery['chat_buckets']):
+        if chat_id not in delivery['chats'] and now - delivery['chat_buckets'][chat_id]['time'] > full_time:
+            del delivery['chat_buckets'][chat_id]
+
+
+def delivery_hold(seconds: float):
+
+    if delivery['global_bucket'] is None:
+        return
+
+    with delivery['condition']:
+        bucket = delivery['global_bucket']
+        bucket['tokens'] = min(bucket['tokens'], -seconds * bucket['rate'])
+        bucket['time'] = time.monotonic()
+
+
+my_logger = logging.getLogger('message_delivery')
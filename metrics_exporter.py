@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import time
+import bisect
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Defaults for the metrics settings in config.json
+METRICS_DEFAULTS = {
+    'enabled': False,
+    'listen': '127.0.0.1',
+    'port': 9464,
+    'path': '/metrics'
+}
+
+# Upper bounds of the latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Type and description of the exported metrics
+METRICS_HELP = {
+    'mosaic_handler_seconds': ('histogram', 'Time spent in the update handlers'),
+    'mosaic_handler_errors_total': ('counter', 'Updates that raised an error in a handler'),
+    'mosaic_button_seconds': ('histogram', 'Time spent processing a button per keyboard layer'),
+    'mosaic_api_seconds': ('histogram', 'Duration of the Bot API calls per method'),
+    'mosaic_api_errors_total': ('counter', 'Failed Bot API calls per method and error'),
+    'mosaic_snapshot_reloads_total': ('counter', 'Reloads of the blog snapshot'),
+    'mosaic_cache_requests_total': ('counter', 'Cache lookups per cache and result')
+}
+
+# Collected values, keyed by metric name and label pairs
+metrics = {
+    'enabled': False,
+    'lock': threading.Lock(),
+    'counters': {},
+    'histograms': {},
+    'server': None
+}
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        if self.path.split('?')[0] != self.server.metrics_path:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = metrics_render().encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+
+        my_logger.debug('Metrics %s: ' + format, self.address_string(), *args)
+
+
+def metrics_get_settings(config: dict) -> dict:
+
+    settings = dict(METRICS_DEFAULTS)
+    settings.update(config.get('metrics', {}))
+
+    return(settings)
+
+
+def metrics_start(config: dict):
+
+    settings = metrics_get_settings(config)
+
+    if not settings['enabled'] or metrics['server'] is not None:
+        return
+
+    server = ThreadingHTTPServer((settings['listen'], settings['port']), MetricsRequestHandler)
+    server.daemon_threads = True
+    server.metrics_path = settings['path']
+
+    metrics['server'] = server
+    metrics['enabled'] = True
+
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    my_logger.info('Metrics exported on %s:%s%s', settings['listen'], settings['port'], settings['path'])
+
+
+def metrics_count(name: str, labels: tuple, amount: float = 1):
+
+    if not metrics['enabled']:
+        return
+
+    with metrics['lock']:
+        key = (name, labels)
+        metrics['counters'][key] = metrics['counters'].get(key, 0) + amount
+
+
+def metrics_observe(name: str, labels: tuple, seconds: float):
+
+    if not metrics['enabled']:
+        return
+
+    with metrics['lock']:
+        histogram = metrics['histograms'].get((name, labels))
+        if histogram is None:
+            histogram = {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+            metrics['histograms'][(name, labels)] = histogram
+
+        histogram['buckets'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+
+def metrics_wrap_handler(name: str, callback):
+
+    # Without metrics the handler is registered as it is
+    if not metrics['enabled']:
+        return(callback)
+
+    def timed_callback(*args):
+        started = time.perf_counter()
+        try:
+            return(callback(*args))
+
+        except Exception:
+            metrics_count('mosaic_handler_errors_total', (('handler', name),))
+            raise
+
+        finally:
+            metrics_observe('mosaic_handler_seconds', (('handler', name),), time.perf_counter() - started)
+
+    return(timed_callback)
+
+
+def metrics_render() -> str:
+
+    with metrics['lock']:
+        counters = dict(metrics['counters'])
+        histograms = {key: dict(value, buckets=list(value['buckets']))
+                      for key, value in metrics['histograms'].items()}
+
+    lines = []
+
+    for name, (metric_type, description) in METRICS_HELP.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {metric_type}')
+
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f'{name}{metrics_format_labels(labels)} {value}')
+
+        for (histogram_name, labels), histogram in sorted(histograms.items()):
+            if histogram_name != name:
+                continue
+
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',), histogram['buckets']):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{metrics_format_labels(labels + (("le", str(bound)),))} {cumulative}')
+
+            lines.append(f'{name}_sum{metrics_format_labels(labels)} {histogram["sum"]}')
+            lines.append(f'{name}_count{metrics_format_labels(labels)} {histogram["count"]}')
+
+    return('\n'.join(lines) + '\n')
+
+
+def metrics_format_labels(labels: tuple) -> str:
+
+    if not labels:
+        return('')
+
+    label_parts = []
+    for label, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        label_parts.append(f'{label}="{value}"')
+
+    return('{' + ','.join(label_parts) + '}')
+
+
+my_logger = logging.getLogger('metrics_exporter')
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import random
+import datetime
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import logging
+
+import run_mosaic_bot as mosaic
+import entry_store
+
+# Feed sizes used without --sizes
+BENCHMARK_SIZES = (500, 5000, 50000, 200000)
+
+# Share of the entry kinds and of the media types of mosaic entries in the feed
+FEED_KINDS = (('mosaic', 0.6), ('news', 0.3), ('weekly', 0.1))
+FEED_MEDIA_TYPES = (('image', 0.5), ('video', 0.25), ('youtube', 0.15), ('', 0.1))
+
+# Entries are spread over this many days, larger feeds get several entries per day
+FEED_DAYS = 3650
+
+# Minimal time one measurement is repeated for
+MIN_SECONDS = 0.5
+
+
+def main():
+
+    arguments = bench_get_arguments()
+    random.seed(arguments.seed)
+
+    results = {
+        'revision': bench_get_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': datetime.datetime.now().isoformat(timespec='seconds'),
+        'storage': arguments.storage,
+        'results': []
+    }
+
+    mosaic.catalog_reload()
+
+    with tempfile.TemporaryDirectory() as data_path:
+        for size in arguments.sizes:
+            my_logger.warning('Benchmark with %s entries', size)
+
+            config = bench_create_config(data_path, arguments.storage)
+            feed = bench_create_feed(size)
+            bench_write_feed(config, feed)
+
+            for result in bench_run(config, feed, size, arguments.min_seconds):
+                my_logger.warning('  %-28s %12.1f ops/s %10.1f kB peak',
+                                  result['benchmark'], result['per_second'], result['memory_peak'] / 1024)
+                results['results'].append(result)
+
+    with open(arguments.output, 'w') as result_file:
+        json.dump(results, result_file, indent=2)
+
+    my_logger.warning('Results written to %s', arguments.output)
+
+
+def bench_get_arguments() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Micro benchmarks of the MOSAIC bot data path')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(BENCHMARK_SIZES),
+                        help='number of entries of the generated feeds')
+    parser.add_argument('--storage', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--min-seconds', type=float, default=MIN_SECONDS,
+                        help='minimal duration of each measurement')
+    parser.add_argument('--seed', type=int, default=2019)
+    parser.add_argument('--output', default=f'benchmark_{datetime.date.today().isoformat()}.json')
+
+    return(parser.parse_args())
+
+
+def bench_get_revision() -> str:
+
+    try:
+        return(subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.abspath(os.path.dirname(__file__))).stdout.strip())
+
+    except OSError:
+        return('')
+
+
+def bench_create_config(data_path: str, storage: str) -> dict:
+
+    config = dict(mosaic.get_config(os.path.abspath(os.path.dirname(__file__))))
+    config['data_path'] = data_path
+    config['data_file'] = 'mosaic_data'
+    config['storage'] = storage
+
+    # The bot reads its configuration through the cache of the script path
+    mosaic.config_cache[os.path.abspath(os.path.dirname(__file__))] = mosaic.config_freeze(config)
+
+    return(config)
+
+
+def bench_create_feed(size: int) -> dict:
+
+    today = datetime.date.today()
+    entries_per_day = max(1, -(-size // FEED_DAYS))
+
+    blog = []
+    for number in range(size):
+        date = (today - datetime.timedelta(days=number // entries_per_day)).isoformat()
+        blog.append(bench_create_entry(number, date, bench_choose(FEED_KINDS)))
+
+    return({'blog': blog})
+
+
+def bench_create_entry(number: int, date: str, kind: str) -> dict:
+
+    text_length = random.randint(200, 2000)
+
+    entry = {
+        'date': date,
+        'kind': kind,
+        'title_de': f'Eintrag {number}',
+        'title_en': f'Entry {number}',
+        'text_de': 'Eis & Schnee <Drift> ' * (text_length // 20),
+        'text_en': 'Ice & snow <drift> ' * (text_length // 20),
+        'permalink': f'https://follow.mosaic-expedition.org/entry/{number}'
+    }
+
+    if kind == 'mosaic':
+        media_type = bench_choose(FEED_MEDIA_TYPES)
+        entry['media_type'] = media_type
+
+        if media_type == 'image':
+            entry['image'] = {'url': f'https://follow.mosaic-expedition.org/img/{number}.jpg',
+                              'caption': f'Image {number}'}
+
+        elif media_type == 'video':
+            for language in ('de', 'en'):
+                entry[f'video_{language}'] = {'url': f'https://follow.mosaic-expedition.org/vid/{number}_{language}.mp4',
+                                              'title': f'Video {number} {language}'}
+
+        elif media_type == 'youtube':
+            entry['youtube_de'] = f'yt{number:09d}'
+
+    return(entry)
+
+
+def bench_choose(choices: tuple) -> str:
+
+    value = random.random()
+
+    for choice, share in choices:
+        value -= share
+        if value < 0:
+            return(choice)
+
+    return(choices[-1][0])
+
+
+def bench_write_feed(config: dict, feed: dict):
+
+    data_filename = f'{config["data_path"]}/{config["data_file"]}.{mosaic.FILE_TYPE}'
+
+    with open(data_filename, 'w') as data_file:
+        json.dump(feed, data_file)
+
+    if config['storage'] == 'sqlite':
+        entry_store.store_write(config, feed['blog'])
+
+    mosaic.blog_snapshot = None
+
+
+def bench_run(config: dict, feed: dict, size: int, min_seconds: float) -> list:
+
+    mosaic_dates = sorted({entry['date'] for entry in feed['blog'] if entry['kind'] == 'mosaic'})
+    dates = [random.choice(mosaic_dates) for _ in range(1000)]
+    languages = ('en', 'de')
+
+    results = []
+
+    # The snapshot is dropped before each call, so the file is parsed every time
+    results.append(bench_measure('data_read_blog_from_file', size, min_seconds, lambda: (
+        bench_reset_snapshot(), mosaic.data_read_blog_from_file(config))))
+
+    blog = mosaic.data_read_blog_from_file(config)
+
+    results.append(bench_measure('get_calendar_from_blog', size, min_seconds, lambda: (
+        mosaic.get_calendar_from_blog('mosaic'))))
+
+    results.append(bench_measure('get_blog_entry_latest', size, min_seconds, lambda: (
+        mosaic.get_blog_entry_latest(mosaic.KEYBOARD_BUTTONS['last']),
+        mosaic.get_blog_entry_latest(mosaic.KEYBOARD_BUTTONS['second'])), operations=2))
+
+    results.append(bench_measure('get_blog_entry_by_date', size, min_seconds, lambda: [
+        mosaic.get_blog_entry_by_date(date) for date in dates], operations=len(dates)))
+
+    entries = blog[:1000]
+    results.append(bench_measure('blog_entry_create', size, min_seconds, lambda: [
+        mosaic.blog_entry_create(language, entry) for entry in entries for language in languages],
+        operations=len(entries) * len(languages)))
+
+    results.append(bench_measure('create_top_level_keyboard', size, min_seconds, lambda: [
+        mosaic.create_top_level_keyboard(language) for language in languages], operations=len(languages)))
+
+    year = mosaic.get_date_part(mosaic_dates[-1], mosaic.KEYBOARD_LAYER['year'])
+    month = mosaic_dates[-1][:7]
+
+    results.append(bench_measure('create_calender_menu', size, min_seconds, lambda: (
+        mosaic.create_calender_menu(mosaic.KEYBOARD_LAYER['year'], ''),
+        mosaic.create_calender_menu(mosaic.KEYBOARD_LAYER['month'], year),
+        mosaic.create_calender_menu(mosaic.KEYBOARD_LAYER['day'], month)), operations=3))
+
+    results.append(bench_measure('get_keyboard_markup', size, min_seconds, lambda: (
+        mosaic.get_keyboard_markup(mosaic.KEYBOARD_LAYER['main'], '', 'en'),
+        mosaic.get_keyboard_markup(mosaic.KEYBOARD_LAYER['month'], year, 'de')), operations=2))
+
+    return(results)
+
+
+def bench_reset_snapshot():
+
+    mosaic.blog_snapshot = None
+
+
+def bench_measure(name: str, size: int, min_seconds: float, function, operations: int = 1) -> dict:
+
+    # A first call outside the measurement fills caches and imports
+    function()
+
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        function()
+        calls += 1
+
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            break
+
+    # Tracing allocations slows the calls down, memory is measured separately
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    function()
+    memory_current, memory_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        'benchmark': name,
+        'size': size,
+        'calls': calls,
+        'operations': calls * operations,
+        'seconds': elapsed,
+        'per_second': calls * operations / elapsed,
+        'seconds_per_operation': elapsed / (calls * operations),
+        'memory_retained': memory_current - memory_before,
+        'memory_peak': memory_peak - memory_before
+    }
+
+    return(result)
+
+
+my_logger = logging.getLogger('run_benchmark')
+
+if __name__ == '__main__':
+    my_logger.addHandler(logging.StreamHandler(sys.stdout))
+    main()
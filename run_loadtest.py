@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import signal
+import datetime
+import argparse
+import tempfile
+import threading
+import email.parser
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import run_mosaic_bot as mosaic
+import run_benchmark
+
+# Token of the simulated bot, the fake API accepts nothing else
+LOADTEST_TOKEN = '123456:loadtest'
+
+# Methods that deliver something to the user, only these get faults injected
+DELIVERY_METHODS = ('sendMessage', 'sendPhoto', 'editMessageReplyMarkup')
+
+# Steps of one user session, with the call that finishes each step
+SESSION_STEPS = (
+    ('start', 'keyboard'),
+    ('latest', 'keyboard'),
+    ('calendar', 'edit'),
+    ('year', 'edit'),
+    ('month', 'edit'),
+    ('day', 'keyboard')
+)
+
+# Read timeout of the bot requests in seconds
+REQUEST_TIMEOUT = 5
+
+# Time a step may take before it is counted as lost
+STEP_TIMEOUT = 60
+
+# Shared state of the fake Bot API and the sessions
+fake_api = {
+    'condition': threading.Condition(),
+    'updates': [],
+    'next_update_id': 1,
+    'next_message_id': 1,
+    'closing': False,
+    'chats': {},
+    'messages': 0,
+    'faults': {'retry_after': 0, 'timeout': 0},
+    'settings': None
+}
+
+
+class FakeApiRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+
+        token, _, method = self.path.strip('/').partition('/')
+        if token != f'bot{LOADTEST_TOKEN}':
+            self.send_api_response(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            return
+
+        params = fake_read_params(self)
+        status, response = fake_call(method, params)
+
+        if status is None:
+            # The request timed out on the client side, the connection is dropped
+            self.close_connection = True
+            return
+
+        self.send_api_response(status, response)
+
+    do_GET = do_POST
+
+    def send_api_response(self, status: int, response: dict):
+
+        body = json.dumps(response).encode('utf-8')
+
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        except OSError:
+            self.close_connection = True
+
+    def log_message(self, format: str, *args):
+
+        my_logger.debug('Fake API %s: ' + format, self.address_string(), *args)
+
+
+def main():
+
+    arguments = loadtest_get_arguments()
+    random.seed(arguments.seed)
+
+    with tempfile.TemporaryDirectory() as data_path:
+        server = fake_start(arguments)
+        config = loadtest_create_config(arguments, data_path, server.server_address[1])
+
+        feed = run_benchmark.bench_create_feed(arguments.entries)
+        run_benchmark.bench_write_feed(config, feed)
+
+        results = {'steps': [], 'lost': 0}
+        driver = threading.Thread(target=loadtest_drive, args=(arguments, results), name='driver', daemon=True)
+
+        started = time.perf_counter()
+        driver.start()
+
+        # The bot runs in the main thread, it stops on the interrupt sent by the driver
+        mosaic.main()
+
+        duration = time.perf_counter() - started
+        fake_stop(server)
+
+    report = loadtest_create_report(arguments, results, duration)
+    loadtest_print_report(report)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+        my_logger.warning('Report written to %s', arguments.output)
+
+
+def loadtest_get_arguments() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Load test of the MOSAIC bot against a local fake Bot API')
+    parser.add_argument('--users', type=int, default=50, help='number of concurrent users')
+    parser.add_argument('--sessions', type=int, default=2, help='sessions per user')
+    parser.add_argument('--think-time', type=float, default=0.0, help='pause of a user between two steps')
+    parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads')
+    parser.add_argument('--response-mode', choices=('separate', 'combined'), default='separate')
+    parser.add_argument('--entries', type=int, default=2000, help='entries of the generated feed')
+    parser.add_argument('--retry-after-rate', type=float, default=0.0,
+                        help='share of the deliveries answered with a flood limit')
+    parser.add_argument('--retry-after', type=int, default=1, help='seconds of an injected flood limit')
+    parser.add_argument('--timeout-rate', type=float, default=0.0,
+                        help='share of the deliveries that get no answer in time')
+    parser.add_argument('--timeout-delay', type=float, default=REQUEST_TIMEOUT + 1,
+                        help=f'seconds an injected timeout keeps the request open, more than {REQUEST_TIMEOUT}')
+    parser.add_argument('--no-rate-limit', action='store_true',
+                        help='lift the per chat and global send rates of the bot')
+    parser.add_argument('--seed', type=int, default=2019)
+    parser.add_argument('--output', default='', help='file for the report as JSON')
+
+    return(parser.parse_args())
+
+
+def loadtest_create_config(arguments: argparse.Namespace, data_path: str, port: int) -> dict:
+
+    script_path = os.path.abspath(os.path.dirname(__file__))
+    config = json.loads(json.dumps(mosaic.get_config(script_path), default=dict))
+
+    token_filename = f'{data_path}/bot_token'
+    with open(token_filename, 'w') as token_file:
+        token_file.write(LOADTEST_TOKEN)
+
+    image_filename = f'{data_path}/start_image.png'
+    with open(image_filename, 'wb') as image_file:
+        image_file.write(os.urandom(2048))
+
+    config.update({
+        'data_path': data_path,
+        'data_file': 'mosaic_data',
+        'storage': 'json',
+        'token_filename': token_filename,
+        'start_image': image_filename,
+        'api_url': f'http://127.0.0.1:{port}',
+        'mode': 'polling',
+        'engine': arguments.engine,
+        'concurrent': True,
+        'response_mode': arguments.response_mode,
+        'debounce_seconds': 0
+    })
+
+    # Same read timeout as python-telegram-bot, an injected timeout answers later than this
+    config.setdefault('async_engine', {})['request_timeout'] = REQUEST_TIMEOUT
+    config['async_engine']['poll_timeout'] = 1
+
+    if arguments.no_rate_limit:
+        config.setdefault('delivery', {}).update({
+            'global_rate': 1000000, 'global_burst': 1000000, 'chat_rate': 1000000, 'chat_burst': 1000000})
+
+    # The bot reads its configuration through the cache of the script path
+    mosaic.config_cache[script_path] = mosaic.config_freeze(config)
+
+    return(config)
+
+
+def fake_start(arguments: argparse.Namespace) -> ThreadingHTTPServer:
+
+    fake_api['settings'] = {
+        'retry_after_rate': arguments.retry_after_rate,
+        'retry_after': arguments.retry_after,
+        'timeout_rate': arguments.timeout_rate,
+        'timeout_delay': arguments.timeout_delay
+    }
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeApiRequestHandler)
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, name='fake_api', daemon=True).start()
+    my_logger.warning('Fake Bot API listening on port %s', server.server_address[1])
+
+    return(server)
+
+
+def fake_stop(server: ThreadingHTTPServer):
+
+    server.shutdown()
+    server.server_close()
+
+
+def fake_read_params(request: BaseHTTPRequestHandler) -> dict:
+
+    content_length = int(request.headers.get('Content-Length', 0))
+    body = request.rfile.read(content_length) if content_length > 0 else b''
+    content_type = request.headers.get('Content-Type', '')
+
+    if not body:
+        return({})
+
+    if content_type.startswith('multipart/form-data'):
+        message = email.parser.BytesParser().parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+
+        params = {}
+        for part in message.get_payload():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename() is None:
+                params[name] = part.get_payload(decode=True).decode('utf-8')
+            else:
+                params[name] = '<file>'
+
+        return(params)
+
+    return(json.loads(body.decode('utf-8')))
+
+
+def fake_call(method: str, params: dict) -> tuple:
+
+    settings = fake_api['settings']
+
+    if method == 'getUpdates':
+        return(200, {'ok': True, 'result': fake_get_updates(params)})
+
+    if method == 'getMe':
+        return(200, {'ok': True, 'result': {
+            'id': int(LOADTEST_TOKEN.split(':')[0]), 'is_bot': True,
+            'first_name': 'Load test', 'username': 'loadtest_bot'}})
+
+    if method not in DELIVERY_METHODS:
+        return(200, {'ok': True, 'result': True})
+
+    fault = random.random()
+
+    if fault < settings['retry_after_rate']:
+        with fake_api['condition']:
+            fake_api['faults']['retry_after'] += 1
+
+        return(429, {'ok': False, 'error_code': 429,
+                     'description': f'Too Many Requests: retry after {settings["retry_after"]}',
+                     'parameters': {'retry_after': settings['retry_after']}})
+
+    if fault < settings['retry_after_rate'] + settings['timeout_rate']:
+        with fake_api['condition']:
+            fake_api['faults']['timeout'] += 1
+
+        time.sleep(settings['timeout_delay'])
+        return(None, None)
+
+    return(200, {'ok': True, 'result': fake_deliver(method, params)})
+
+
+def fake_get_updates(params: dict) -> list:
+
+    offset = int(params.get('offset') or 0)
+    timeout = min(float(params.get('timeout') or 0), 2.0)
+    deadline = time.monotonic() + timeout
+
+    with fake_api['condition']:
+        # Confirmed updates are dropped like on the real server
+        fake_api['updates'] = [update for update in fake_api['updates'] if update['update_id'] >= offset]
+
+        while not fake_api['updates'] and not fake_api['closing']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            fake_api['condition'].wait(remaining)
+
+        return(list(fake_api['updates'][:100]))
+
+
+def fake_deliver(method: str, params: dict) -> dict:
+
+    chat_id = int(params['chat_id'])
+    reply_markup = params.get('reply_markup')
+    if isinstance(reply_markup, str):
+        reply_markup = json.loads(reply_markup)
+
+    with fake_api['condition']:
+        if method == 'editMessageReplyMarkup':
+            message_id = int(params['message_id'])
+        else:
+            message_id = fake_api['next_message_id']
+            fake_api['next_message_id'] += 1
+
+        fake_api['messages'] += 1
+        chat = fake_api['chats'].get(chat_id)
+
+    message = {
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private', 'first_name': f'User {chat_id}'}
+    }
+
+    if method == 'sendPhoto':
+        message['photo'] = [{'file_id': f'photo_{message_id}', 'file_unique_id': f'u{message_id}',
+                             'width': 320, 'height': 240}]
+    else:
+        message['text'] = params.get('text', '')
+
+    if reply_markup is not None:
+        message['reply_markup'] = reply_markup
+
+    # The session of the chat learns about every delivered message
+    if chat is not None:
+        chat.put((time.perf_counter(), method, message))
+
+    return(message)
+
+
+def fake_put_update(update: dict) -> float:
+
+    with fake_api['condition']:
+        update['update_id'] = fake_api['next_update_id']
+        fake_api['next_update_id'] += 1
+        fake_api['updates'].append(update)
+        fake_api['condition'].notify_all()
+
+    return(time.perf_counter())
+
+
+def loadtest_drive(arguments: argparse.Namespace, results: dict):
+
+    # The bot needs a moment to connect before the first update is offered
+    time.sleep(1)
+
+    users = [threading.Thread(target=loadtest_run_user, args=(arguments, 100000 + number, results),
+                              name=f'user_{number}', daemon=True)
+             for number in range(arguments.users)]
+
+    for user in users:
+        user.start()
+
+    for user in users:
+        user.join()
+
+    with fake_api['condition']:
+        fake_api['closing'] = True
+        fake_api['condition'].notify_all()
+
+    os.kill(os.getpid(), signal.SIGINT)
+
+
+def loadtest_run_user(arguments: argparse.Namespace, user_id: int, results: dict):
+
+    responses = queue.Queue()
+    with fake_api['condition']:
+        fake_api['chats'][user_id] = responses
+
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}',
+            'language_code': random.choice(('de', 'en'))}
+
+    for session in range(arguments.sessions):
+        keyboard_message = None
+
+        for step, finish in SESSION_STEPS:
+            update = loadtest_create_update(step, user, keyboard_message)
+            if update is None:
+                break
+
+            offered = fake_put_update(update)
+            finished, keyboard_message = loadtest_wait_for_step(responses, finish, keyboard_message)
+
+            with fake_api['condition']:
+                if finished is None:
+                    results['lost'] += 1
+                else:
+                    results['steps'].append((step, finished - offered))
+
+            if finished is None:
+                break
+
+            if arguments.think_time > 0:
+                time.sleep(random.uniform(0, 2 * arguments.think_time))
+
+
+def loadtest_create_update(step: str, user: dict, keyboard_message: dict) -> dict:
+
+    chat = {'id': user['id'], 'type': 'private', 'first_name': user['first_name']}
+
+    if step == 'start':
+        return({'message': {
+            'message_id': random.randint(1, 2 ** 30), 'date': int(time.time()), 'chat': chat, 'from': user,
+            'text': '/start', 'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]}})
+
+    if keyboard_message is None:
+        return(None)
+
+    buttons = [button['callback_data'] for row in keyboard_message['reply_markup']['inline_keyboard']
+               for button in row if not button['callback_data'].endswith('_top')]
+
+    # The main keyboard has fixed buttons, the calendar layers get a random choice
+    if step == 'latest':
+        callback_data = f'{mosaic.BUTTON_FUNCTION["command"]}_{mosaic.KEYBOARD_LAYER["main"]}_{mosaic.KEYBOARD_BUTTONS["last"]}'
+    elif step == 'calendar':
+        callback_data = f'{mosaic.BUTTON_FUNCTION["menu"]}_{mosaic.KEYBOARD_LAYER["main"]}_{mosaic.KEYBOARD_BUTTONS["calendar"]}'
+    elif buttons:
+        callback_data = random.choice(buttons)
+    else:
+        return(None)
+
+    return({'callback_query': {
+        'id': str(random.randint(1, 2 ** 62)), 'from': user, 'chat_instance': str(user['id']),
+        'message': keyboard_message, 'data': callback_data}})
+
+
+def loadtest_wait_for_step(responses: queue.Queue, finish: str, keyboard_message: dict) -> tuple:
+
+    deadline = time.monotonic() + STEP_TIMEOUT
+
+    while True:
+        try:
+            delivered, method, message = responses.get(timeout=max(0.0, deadline - time.monotonic()))
+
+        except queue.Empty:
+            return(None, keyboard_message)
+
+        if 'reply_markup' not in message:
+            continue
+
+        if finish == 'edit' and method == 'editMessageReplyMarkup':
+            return(delivered, message)
+
+        if finish == 'keyboard' and method != 'editMessageReplyMarkup':
+            return(delivered, message)
+
+
+def loadtest_create_report(arguments: argparse.Namespace, results: dict, duration: float) -> dict:
+
+    report = {
+        'started': datetime.datetime.now().isoformat(timespec='seconds'),
+        'engine': arguments.engine,
+        'response_mode': arguments.response_mode,
+        'users': arguments.users,
+        'sessions': arguments.sessions,
+        'duration': duration,
+        'messages': fake_api['messages'],
+        'messages_per_second': fake_api['messages'] / duration,
+        'faults': dict(fake_api['faults']),
+        'lost_steps': results['lost'],
+        'latency': {}
+    }
+
+    steps = {'all': [latency for _, latency in results['steps']]}
+    for step, latency in results['steps']:
+        steps.setdefault(step, []).append(latency)
+
+    for step, latencies in steps.items():
+        latencies.sort()
+        report['latency'][step] = {
+            'count': len(latencies),
+            'p50': loadtest_percentile(latencies, 50),
+            'p95': loadtest_percentile(latencies, 95),
+            'p99': loadtest_percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None
+        }
+
+    return(report)
+
+
+def loadtest_percentile(latencies: list, percent: float) -> float:
+
+    if not latencies:
+        return(None)
+
+    return(latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))])
+
+
+def loadtest_print_report(report: dict):
+
+    my_logger.warning('%s users, %s sessions each, %s engine, %s responses',
+                      report['users'], report['sessions'], report['engine'], report['response_mode'])
+    my_logger.warning('%s messages in %.1f seconds, %.1f messages per second',
+                      report['messages'], report['duration'], report['messages_per_second'])
+    my_logger.warning('Injected faults: %s, lost steps: %s', report['faults'], report['lost_steps'])
+    my_logger.warning('%-10s %7s %9s %9s %9s %9s', 'step', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms')
+
+    for step, latency in report['latency'].items():
+        if latency['count'] == 0:
+            continue
+
+        my_logger.warning('%-10s %7s %9.1f %9.1f %9.1f %9.1f', step, latency['count'],
+                          latency['p50'] * 1000, latency['p95'] * 1000, latency['p99'] * 1000,
+                          latency['max'] * 1000)
+
+
+my_logger = logging.getLogger('run_loadtest')
+
+if __name__ == '__main__':
+    my_logger.addHandler(logging.StreamHandler(sys.stdout))
+    main()
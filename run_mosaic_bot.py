@@ -3,15 +3,34 @@
 import requests
 import json
 import datetime
-import locale
+import html
+import hashlib
+import time
+import bisect
+import sqlite3
 import os
 import sys
 import logging
-from logging.handlers import RotatingFileHandler
+from concurrent.futures import Future
+import threading
+import asyncio
+import signal
+import types
+import atexit
+import collections
 
 import telegram
 import telegram.ext
 
+import webhook_listener
+import message_delivery
+import entry_store
+import entry_model
+import async_engine
+import log_pipeline
+import metrics_exporter
+import update_profiler
+
 from telegram.error import TelegramError, Unauthorized, BadRequest, TimedOut, ChatMigrated, NetworkError
 
 FILE_TYPE = 'json'
@@ -47,35 +66,145 @@ error = {
     'os_err': 'An OS error occurred'
 }
 
+# Configuration per script path, loaded once and read only
+config_cache = {}
+
+# Language used when a text is missing in the language of the user
+FALLBACK_LANGUAGE = 'en'
+
+# Month names for the dates in the messages
+MONTH_NAMES = {
+    'de': ('Januar', 'Februar', 'März', 'April', 'Mai', 'Juni', 'Juli',
+           'August', 'September', 'Oktober', 'November', 'Dezember'),
+    'en': ('January', 'February', 'March', 'April', 'May', 'June', 'July',
+           'August', 'September', 'October', 'November', 'December')
+}
+
+# Formatted dates per date and language
+localized_dates = {}
+
+# Texts and button captions from messages.json, per language
+message_catalog = None
+
+# Telegram file ids of uploaded media, persisted next to the data file
+media_cache = None
+media_hashes = {}
+media_lock = threading.Lock()
+
+# Computations in progress, shared by identical concurrent requests
+inflight_requests = {}
+inflight_lock = threading.Lock()
+
+# Time of the last press per chat, message and button
+recent_buttons = {}
+
+# Cache for the blog snapshot, always replaced as a whole after a reload
+blog_snapshot = None
+snapshot_lock = threading.Lock()
+
+# Messages rendered on demand from the SQLite store, the least recently used are dropped
+MESSAGE_CACHE_SIZE = 2000
+message_lock = threading.Lock()
+
 
 def main():
 
     try:
 
         config = get_config(os.path.abspath(os.path.dirname(__file__)))
-        my_logger.info(f'Path to the data file: {config["data_path"]}')
-        my_logger.info(f'Name of the data file: {config["data_file"]}')
-
-        my_logger.info(f'Start the bot updater')
+        my_logger.info('Path to the data file: %s', config["data_path"])
+        my_logger.info('Name of the data file: %s', config["data_file"])
+
+        mode = config.get('mode', 'polling')
+        my_logger.info('Bot mode: %s', mode)
+
+        if config.get('engine') == 'asyncio':
+            my_logger.info('Starting the asyncio engine')
+            catalog_reload()
+            metrics_exporter.metrics_start(config)
+            if hasattr(signal, 'SIGHUP'):
+                signal.signal(signal.SIGHUP, handler_sighup)
+            if hasattr(signal, 'SIGUSR1'):
+                signal.signal(signal.SIGUSR1, handler_sigusr1)
+            if hasattr(signal, 'SIGUSR2'):
+                signal.signal(signal.SIGUSR2, handler_sigusr2)
+            write_pid_file(config)
+
+            async_engine.engine_run(config, get_bot_token().strip(), {
+                'commands': {'start': handler_instrument(config, 'start', handler_start),
+                             'reload': metrics_exporter.metrics_wrap_handler('reload', handler_reload),
+                             'profile': handler_profile},
+                'button': handler_instrument(config, 'button', handler_button),
+                'error': handler_error,
+                'prepare': handler_prepare
+            })
+            return
+
+        my_logger.info('Start the bot updater')
+        api_url = config.get('api_url')
         updater = telegram.ext.Updater(
-            get_bot_token(), use_context=True)
-        my_logger.info(f'Bot {updater.bot.name} started')
-
-        my_logger.info(f'Adding the dispatchers')
+            get_bot_token(), base_url=f'{api_url}/bot' if api_url else None,
+            workers=config.get('workers', 4), use_context=True)
+        my_logger.info('Bot %s started', updater.bot.name)
+
+        catalog_reload()
+        metrics_exporter.metrics_start(config)
+        message_delivery.delivery_start(config)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, handler_sighup)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, handler_sigusr1)
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2, handler_sigusr2)
+        write_pid_file(config)
+
+        my_logger.info('Adding the dispatchers')
         updater.dispatcher.add_handler(
-            telegram.ext.CommandHandler('start', handler_start))
+            telegram.ext.CommandHandler('start', handler_concurrent(
+                updater.dispatcher, handler_instrument(config, 'start', handler_start), mode)))
         updater.dispatcher.add_handler(
-            telegram.ext.CallbackQueryHandler(handler_button))
+            telegram.ext.CallbackQueryHandler(handler_concurrent(
+                updater.dispatcher, handler_instrument(config, 'button', handler_button), mode)))
+        updater.dispatcher.add_handler(
+            telegram.ext.CommandHandler('reload', metrics_exporter.metrics_wrap_handler('reload', handler_reload)))
+        updater.dispatcher.add_handler(
+            telegram.ext.CommandHandler('profile', handler_profile))
         # updater.dispatcher.add_handler(CommandHandler('help', handler_help))
         updater.dispatcher.add_error_handler(handler_error)
-        my_logger.info(f'Dispatcher successfull added')
+        my_logger.info('Dispatcher successfull added')
 
-        my_logger.info(f'Starting bot poller')
-        updater.start_polling()
-        updater.idle()
+        if mode == 'webhook':
+            my_logger.info('Starting bot webhook')
+            webhook_listener.webhook_run(updater, config)
+
+        else:
+            my_logger.info('Starting bot poller')
+            updater.start_polling()
+            updater.idle()
 
     except Exception as err:
-        my_logger.error(f'{error["common"]}: {err}')
+        my_logger.error('%s: %s', error["common"], err)
+
+
+def handler_concurrent(dispatcher: telegram.ext.Dispatcher, callback, mode: str):
+
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
+
+    # Polling stays sequential unless enabled, the webhook hands updates to the worker pool
+    if mode != 'webhook' and not config.get('concurrent', False):
+        return(callback)
+
+    def concurrent_callback(my_update: telegram.update, the_context: telegram.ext.CallbackContext):
+        dispatcher.run_async(callback, my_update, the_context)
+
+    return(concurrent_callback)
+
+
+def handler_instrument(config: dict, name: str, callback):
+
+    # The profiler sees only the handler, the metrics include the profiling overhead
+    return(metrics_exporter.metrics_wrap_handler(
+        name, update_profiler.profiler_wrap_handler(config, callback)))
 
 
 def get_bot_token() -> str:
@@ -84,16 +213,16 @@ def get_bot_token() -> str:
         my_logger.info('Reading configuration')
         config = get_config(os.path.abspath(os.path.dirname(__file__)))
 
-        my_logger.info(f'Token file: {config["token_filename"]}')
+        my_logger.info('Token file: %s', config["token_filename"])
         with open(f'{config["token_filename"]}') as token_file:
             token = token_file.readline()
             token_file.close()
-            my_logger.info(f'Token read from file')
+            my_logger.info('Token read from file')
 
         return(str(token))
 
     except OSError as err:
-        my_logger.error(f'{error["os_err"]}: {err}')
+        my_logger.error('%s: %s', error["os_err"], err)
         sys.exit()
 
     except:
@@ -105,26 +234,163 @@ def data_read_blog_from_file(config: dict) -> dict:
 
     try:
 
-        data_filename = f'{config["data_path"]}/{config["data_file"]}.{FILE_TYPE}'
+        if config.get('storage') == 'sqlite':
+            return(entry_model.entry_create_all(
+                entry_store.store_get_blog(entry_store.store_connect(config))))
+
+        return(data_get_snapshot(config)['blog'])
+
+    except OSError as err:
+        my_logger.error('%s: %s', error["os_err"], err)
+        sys.exit()
+
+    except:
+        my_logger.error(error['common'])
+        sys.exit()
+
+
+def data_get_snapshot(config: dict) -> dict:
+
+    global blog_snapshot
+
+    if config.get('storage') == 'sqlite':
+        return(data_get_store_snapshot(config))
+
+    data_filename = f'{config["data_path"]}/{config["data_file"]}.{FILE_TYPE}'
+    snapshot = blog_snapshot
+
+    try:
+        file_stat = os.stat(data_filename)
+        signature = (data_filename, file_stat.st_mtime_ns,
+                     file_stat.st_size, file_stat.st_ino)
+
+    except OSError as err:
+        if snapshot is None:
+            raise
+
+        my_logger.warning('%s: %s. Using cached snapshot', error["os_err"], err)
+        return(snapshot)
+
+    if snapshot is not None and snapshot['signature'] == signature:
+        return(snapshot)
+
+    with snapshot_lock:
+        if blog_snapshot is None or blog_snapshot['signature'] != signature:
+            blog_snapshot = data_load_snapshot(
+                data_filename, signature, blog_snapshot)
+
+        return(blog_snapshot)
 
-        my_logger.info(f'Opening the data file: {data_filename}')
+
+def data_load_snapshot(data_filename: str, signature: tuple, current_snapshot: dict) -> dict:
+
+    try:
+        my_logger.info('Opening the data file: %s', data_filename)
         with open(data_filename) as data_file:
-            my_logger.info(f'File {data_filename} opened')
+            my_logger.info('File %s opened', data_filename)
 
-            my_logger.info(f'Read JSON data ')
+            my_logger.info('Read JSON data ')
             mosaic_data = json.load(data_file)
             data_file.close()
             my_logger.info('JSON data loaded')
 
-            return(mosaic_data['blog'])
+        snapshot = {
+            'signature': signature,
+            'backend': 'json',
+            'blog': entry_model.entry_create_all(mosaic_data['blog'])
+        }
+        snapshot.update(data_build_date_index(snapshot['blog']))
+        snapshot['calendars'] = data_build_calendars(
+            (entry.kind, entry.date_text) for entry in snapshot['blog'])
+        snapshot['keyboards'] = {}
+        snapshot['messages'] = data_render_messages(snapshot['entries_by_date'].values())
 
-    except OSError as err:
-        my_logger.error(f'{error["os_err"]}: {err}')
-        sys.exit()
+        metrics_exporter.metrics_count('mosaic_snapshot_reloads_total', (('backend', 'json'), ('result', 'loaded')))
+        return(snapshot)
 
-    except:
-        my_logger.error(error['common'])
-        sys.exit()
+    except (ValueError, KeyError) as err:
+        if current_snapshot is None:
+            raise
+
+        # Keep serving the previous blog until the data file changes again
+        my_logger.error('%s: %s. Keeping cached snapshot', error["common"], err)
+        snapshot = dict(current_snapshot)
+        snapshot['signature'] = signature
+        snapshot['keyboards'] = {}
+
+        metrics_exporter.metrics_count('mosaic_snapshot_reloads_total', (('backend', 'json'), ('result', 'failed')))
+        return(snapshot)
+
+
+def data_get_store_snapshot(config: dict) -> dict:
+
+    global blog_snapshot
+
+    snapshot = blog_snapshot
+
+    try:
+        connection = entry_store.store_connect(config)
+        signature = (entry_store.store_get_filename(config),
+                     entry_store.store_get_generation(connection))
+
+    except sqlite3.Error as err:
+        if snapshot is None:
+            raise
+
+        my_logger.warning('%s: %s. Using cached snapshot', error["common"], err)
+        return(snapshot)
+
+    if snapshot is not None and snapshot['signature'] == signature:
+        return(snapshot)
+
+    with snapshot_lock:
+        if blog_snapshot is None or blog_snapshot['signature'] != signature:
+            my_logger.info('Loading the calendars from the entry store')
+
+            # Only the dates are held in memory, entries are queried on demand
+            blog_snapshot = {
+                'signature': signature,
+                'backend': 'sqlite',
+                'calendars': data_build_calendars(entry_store.store_get_dates(connection)),
+                'keyboards': {},
+                'messages': collections.OrderedDict()
+            }
+            metrics_exporter.metrics_count(
+                'mosaic_snapshot_reloads_total', (('backend', 'sqlite'), ('result', 'loaded')))
+
+        return(blog_snapshot)
+
+
+def data_render_messages(blog: list) -> dict:
+
+    my_logger.info('Rendering the messages of the blog')
+
+    messages = {}
+    for language in entry_model.LANGUAGES:
+        for entry in blog:
+            messages[(entry.date_text, language)] = blog_entry_render(entry, language)
+
+    return(messages)
+
+
+def data_build_date_index(blog: list) -> dict:
+
+    my_logger.info('Building the date index of the blog')
+
+    # The blog dates are ISO strings (yyyy-mm-dd), so they sort like dates
+    entries_by_date = {}
+    for entry in blog:
+        if entry.date_text not in entries_by_date:
+            entries_by_date[entry.date_text] = entry
+
+    date_index = {
+        'entries_by_date': entries_by_date,
+        'dates': sorted(entries_by_date.keys())
+    }
+
+    my_logger.info('Date index with %s dates built', len(date_index["dates"]))
+
+    return(date_index)
 
 
 def handler_start(my_update: telegram.update, the_context: telegram.ext.CallbackContext):
@@ -133,18 +399,27 @@ def handler_start(my_update: telegram.update, the_context: telegram.ext.Callback
 
     user_language = get_language_code(my_update.effective_user)
 
-    my_logger.info(f'Creating start mesages')
+    my_logger.info('Creating start mesages')
     message_title = get_message_text('start_message_title', user_language)
     message_text = get_message_text('start_message_text', user_language)
 
-    my_logger.info(f'Sending start messages')
-    my_update.effective_chat.bot.send_message(
+    my_logger.info('Sending start messages')
+    message_delivery.delivery_submit(
+        my_update.effective_chat.id, my_update.effective_chat.bot.send_message,
         my_update.effective_chat.id, text=f'*{message_title}*', parse_mode='Markdown', disable_web_page_preview=True)
 
-    my_update.effective_chat.bot.send_photo(
-        my_update.effective_chat.id, photo=open(config['start_image'], 'rb'), parse_mode='Markdown')
+    media_send_photo(my_update.effective_chat, config['start_image'], parse_mode='Markdown')
+
+    if response_is_combined(config):
+        message_delivery.delivery_submit(
+            my_update.effective_chat.id, my_update.effective_chat.bot.send_message,
+            my_update.effective_chat.id, text=f'{message_text}', parse_mode='Markdown',
+            reply_markup=get_keyboard_markup(KEYBOARD_LAYER['main'], '', user_language),
+            disable_web_page_preview=True)
+        return
 
-    my_update.effective_chat.bot.send_message(
+    message_delivery.delivery_submit(
+        my_update.effective_chat.id, my_update.effective_chat.bot.send_message,
         my_update.effective_chat.id, text=f'{message_text}', parse_mode='Markdown',
         disable_web_page_preview=True)
 
@@ -153,12 +428,28 @@ def handler_start(my_update: telegram.update, the_context: telegram.ext.Callback
 
 def handler_button(my_update: telegram.update, the_context: telegram.ext.CallbackContext):
 
-    my_logger.info(f'Getting pressed button')
+    if button_is_repeated(my_update):
+        my_logger.info('Repeated button press ignored')
+        current_chat = my_update.effective_chat
+        message_delivery.delivery_submit_exempt(
+            current_chat.id, current_chat.bot.answer_callback_query, my_update.callback_query.id)
+        return
+
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
+
+    # The spinner on the button stops before the answer is prepared
+    if response_is_combined(config):
+        current_chat = my_update.effective_chat
+        message_delivery.delivery_submit_exempt(
+            current_chat.id, current_chat.bot.answer_callback_query, my_update.callback_query.id)
+
+    my_logger.info('Getting pressed button')
     pressed_button = get_abstract_button_from_callback(
         my_update.callback_query.data)
-    my_logger.info(f'Pressed button: {pressed_button}')
+    my_logger.info('Pressed button: %s', pressed_button)
 
-    my_logger.info(f'Choosing button processing depending on button type')
+    my_logger.info('Choosing button processing depending on button type')
+    started = time.perf_counter()
 
     if pressed_button['function'] == BUTTON_FUNCTION['command']:
         process_command_buttons(my_update, pressed_button)
@@ -166,6 +457,70 @@ def handler_button(my_update: telegram.update, the_context: telegram.ext.Callbac
     elif pressed_button['function'] == BUTTON_FUNCTION['menu']:
         process_menu_buttons(my_update, pressed_button)
 
+    # Callback data comes from the client, unknown values share one label
+    layer = pressed_button['layer'] if pressed_button['layer'] in KEYBOARD_LAYER.values() else 'other'
+    function = pressed_button['function'] if pressed_button['function'] in BUTTON_FUNCTION.values() else 'other'
+    metrics_exporter.metrics_observe(
+        'mosaic_button_seconds', (('layer', layer), ('function', function)), time.perf_counter() - started)
+
+
+def response_is_combined(config: dict) -> bool:
+
+    return(config.get('response_mode', 'separate') == 'combined')
+
+
+def button_is_repeated(my_update: telegram.update) -> bool:
+
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
+    debounce_seconds = config.get('debounce_seconds', 1.0)
+
+    button_key = (my_update.effective_chat.id, my_update.effective_message.message_id,
+                  my_update.callback_query.data)
+    now = time.monotonic()
+
+    with inflight_lock:
+        last_press = recent_buttons.get(button_key)
+        recent_buttons[button_key] = now
+
+        if len(recent_buttons) > 10000:
+            for key in [key for key, pressed in recent_buttons.items() if now - pressed > debounce_seconds]:
+                del recent_buttons[key]
+
+    return(last_press is not None and now - last_press < debounce_seconds)
+
+
+def coalesce_call(request_key: tuple, function, *args):
+
+    with inflight_lock:
+        request = inflight_requests.get(request_key)
+        is_leader = request is None
+        if is_leader:
+            request = Future()
+            inflight_requests[request_key] = request
+
+    # Identical requests wait for the one already computing the result
+    if not is_leader:
+        return(request.result())
+
+    try:
+        result = function(*args)
+        request.set_result(result)
+        return(result)
+
+    except BaseException as err:
+        request.set_exception(err)
+        raise
+
+    finally:
+        with inflight_lock:
+            del inflight_requests[request_key]
+
+
+def handler_prepare():
+
+    # Loads a changed snapshot before a handler needs it
+    data_get_snapshot(get_config(os.path.abspath(os.path.dirname(__file__))))
+
 
 def handler_error(my_update: telegram.update, the_context: telegram.ext.CallbackContext):
 
@@ -173,15 +528,138 @@ def handler_error(my_update: telegram.update, the_context: telegram.ext.Callback
                     my_update, the_context.error)
 
 
+def handler_reload(my_update: telegram.update, the_context: telegram.ext.CallbackContext):
+
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
+
+    if my_update.effective_user.id not in config.get('admin_ids', ()):
+        my_logger.warning(
+            'User %s is not allowed to reload', my_update.effective_user.id)
+        return
+
+    config = config_reload(os.path.abspath(os.path.dirname(__file__)))
+    catalog_reload()
+
+    user_language = get_language_code(my_update.effective_user)
+
+    message_delivery.delivery_submit(
+        my_update.effective_chat.id, my_update.effective_chat.bot.send_message,
+        my_update.effective_chat.id, text=get_message_text('reload_done', user_language))
+
+
+def handler_profile(my_update: telegram.update, the_context: telegram.ext.CallbackContext):
+
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
+
+    if my_update.effective_user.id not in config.get('admin_ids', ()):
+        my_logger.warning(
+            'User %s is not allowed to profile', my_update.effective_user.id)
+        return
+
+    # /profile [seconds [updates]] starts a session, /profile stop ends it
+    arguments = my_update.effective_message.text.split()[1:]
+
+    try:
+        if arguments[:1] == ['stop']:
+            message_type = 'profile_stopped' if update_profiler.profiler_stop() else 'profile_not_running'
+
+        else:
+            limits = [int(argument) for argument in arguments[:2]]
+            started = update_profiler.profiler_start(config, get_log_path(), *limits)
+            message_type = 'profile_started' if started else 'profile_running'
+
+    except ValueError:
+        message_type = 'profile_usage'
+
+    user_language = get_language_code(my_update.effective_user)
+
+    message_delivery.delivery_submit(
+        my_update.effective_chat.id, my_update.effective_chat.bot.send_message,
+        my_update.effective_chat.id, text=get_message_text(message_type, user_language))
+
+
+def handler_sigusr2(signum: int, frame):
+
+    my_logger.warning('Signal %s received, switching the profiler', signum)
+
+    # Both take the profiler lock, which a handler on the interrupted thread may hold
+    if update_profiler.profiler_is_active():
+        threading.Thread(target=update_profiler.profiler_stop, name='profiler', daemon=True).start()
+
+    else:
+        config = get_config(os.path.abspath(os.path.dirname(__file__)))
+        threading.Thread(target=update_profiler.profiler_start, args=(config, get_log_path()),
+                         name='profiler', daemon=True).start()
+
+
+def get_log_path() -> str:
+
+    return(f'{os.path.abspath(os.path.dirname(__file__))}/log')
+
+
+def handler_sighup(signum: int, frame):
+
+    my_logger.warning(
+        'Signal %s received, reloading configuration and messages', signum)
+    config_reload(os.path.abspath(os.path.dirname(__file__)))
+    catalog_reload()
+
+
+def handler_sigusr1(signum: int, frame):
+
+    my_logger.warning('Signal %s received, loading the new snapshot', signum)
+
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
+    threading.Thread(target=data_get_snapshot, args=(config,),
+                     name='snapshot_loader', daemon=True).start()
+
+
+def get_pid_filename(config: dict) -> str:
+
+    return(config.get('pid_file', f'{config["data_path"]}/mosaic_bot.pid'))
+
+
+def write_pid_file(config: dict):
+
+    try:
+        with open(get_pid_filename(config), 'w') as pid_file:
+            pid_file.write(str(os.getpid()))
+
+    except OSError as err:
+        my_logger.error('%s: %s', error["os_err"], err)
+        return
+
+    atexit.register(remove_pid_file, config)
+
+
+def remove_pid_file(config: dict):
+
+    pid_filename = get_pid_filename(config)
+
+    # A file written by another instance in the meantime is kept
+    try:
+        with open(pid_filename) as pid_file:
+            if pid_file.read().strip() == str(os.getpid()):
+                os.remove(pid_filename)
+
+    except OSError as err:
+        my_logger.debug('PID file not removed: %s', err)
+
+
 def process_command_buttons(my_update: telegram.update, button: dict):
 
-    my_logger.info(f'Processing command button: {button}')
+    my_logger.info('Processing command button: %s', button)
 
     if button['value'] == str(KEYBOARD_BUTTONS['last']) or button['value'] == str(KEYBOARD_BUTTONS['second']):
         send_latest_blog_entry(my_update, button['value'])
 
     elif button['value'] == 'top':
-        send_top_level_keyboard(my_update)
+        config = get_config(os.path.abspath(os.path.dirname(__file__)))
+
+        if response_is_combined(config):
+            edit_top_level_keyboard(my_update)
+        else:
+            send_top_level_keyboard(my_update)
 
     elif button['layer'] == KEYBOARD_LAYER['day']:
         send_blog_entry_by_date(my_update, button)
@@ -189,7 +667,7 @@ def process_command_buttons(my_update: telegram.update, button: dict):
 
 def process_menu_buttons(my_update: telegram.update, button: dict):
 
-    my_logger.info(f'Processing menu button: {button}')
+    my_logger.info('Processing menu button: %s', button)
 
     if button['layer'] == KEYBOARD_LAYER['main'] and button['value'] == KEYBOARD_BUTTONS['calendar']:
         send_year_menu(my_update, button)
@@ -203,47 +681,222 @@ def process_menu_buttons(my_update: telegram.update, button: dict):
 
 def send_latest_blog_entry(my_update: telegram.update, button: str):
 
-    blog_entry = get_blog_entry_latest(button)
-
     user_language = get_language_code(my_update.callback_query.from_user)
 
-    my_logger.info(f'Creating message')
-    message = blog_entry_create(user_language, blog_entry)
+    my_logger.info('Getting message')
+    message_text = coalesce_call(
+        ('latest', button, user_language), get_latest_message, button, user_language)
+
+    my_logger.info('Sending message')
+    blog_entry_send(my_update, message_text)
+
+
+def get_latest_message(mode: str, language: str) -> str:
 
-    my_logger.info(f'Sending message')
-    blog_entry_send(my_update, message)
+    return(get_blog_entry_message(get_blog_entry_latest(mode), language))
+
+
+def get_dated_message(date: str, language: str) -> str:
+
+    return(get_blog_entry_message(get_blog_entry_by_date(date), language))
 
 
 def send_top_level_keyboard(my_update: telegram.update):
 
     user_language = get_language_code(my_update.effective_user)
 
-    my_logger.info(f'Creating keyboard markup')
-    bot_keyboard = telegram.InlineKeyboardMarkup(
-        create_top_level_keyboard(user_language))
+    my_logger.info('Getting keyboard markup')
+    bot_keyboard = get_keyboard_markup(KEYBOARD_LAYER['main'], '', user_language)
 
-    my_logger.info(f'Sending the message including keyboard')
-    my_update.effective_chat.bot.send_message(
+    my_logger.info('Sending the message including keyboard')
+    message_delivery.delivery_submit(
+        my_update.effective_chat.id, my_update.effective_chat.bot.send_message,
         my_update.effective_chat.id, text=f'*{get_message_text("keyboard", user_language)}*', parse_mode='Markdown',
         reply_markup=bot_keyboard, disable_web_page_preview=True)
 
 
-def send_blog_entry_by_date(my_update: telegram.update, button: dict):
+def edit_top_level_keyboard(my_update: telegram.update):
+
+    user_language = get_language_code(my_update.effective_user)
+
+    my_logger.info('Getting keyboard markup')
+    bot_keyboard = get_keyboard_markup(KEYBOARD_LAYER['main'], '', user_language)
+
+    my_logger.info('Replacing the keyboard of the message')
+    message_delivery.delivery_submit(
+        my_update.effective_chat.id, my_update.effective_chat.bot.editMessageReplyMarkup,
+        chat_id=my_update.effective_chat.id, message_id=my_update.effective_message.message_id,
+        reply_markup=bot_keyboard)
+
 
-    blog_entry = get_blog_entry_by_date(button['value'])
+def send_blog_entry_by_date(my_update: telegram.update, button: dict):
 
     user_language = get_language_code(my_update.callback_query.from_user)
 
-    my_logger.info(f'Creating message')
-    message = blog_entry_create(user_language, blog_entry)
+    my_logger.info('Getting message')
+    message_text = coalesce_call(
+        ('date', button['value'], user_language), get_dated_message, button['value'], user_language)
+
+    my_logger.info('Sending message')
+    blog_entry_send(my_update, message_text)
+
+
+def media_send_photo(current_chat: telegram.Chat, source: str, **kwargs) -> Future:
+
+    if asyncio.iscoroutinefunction(current_chat.bot.send_photo):
+        return(message_delivery.delivery_submit(
+            current_chat.id, media_deliver_photo_async, current_chat, source, **kwargs))
+
+    return(message_delivery.delivery_submit(
+        current_chat.id, media_deliver_photo, current_chat, source, **kwargs))
+
+
+def media_deliver_photo(current_chat: telegram.Chat, source: str, **kwargs) -> telegram.Message:
+
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
+
+    media_key = media_get_key(source)
+    file_id = media_get_cache(config).get(media_key)
+    metrics_exporter.metrics_count(
+        'mosaic_cache_requests_total', (('cache', 'media'), ('result', 'miss' if file_id is None else 'hit')))
+
+    if file_id is not None:
+        try:
+            my_logger.info('Sending cached photo %s', media_key)
+            return(current_chat.bot.send_photo(current_chat.id, photo=file_id, **kwargs))
+
+        except BadRequest as err:
+            my_logger.warning('Cached photo %s rejected: %s', media_key, err)
+
+    my_logger.info('Uploading photo %s', source)
+    if source.startswith(('http://', 'https://')):
+        sent_message = current_chat.bot.send_photo(
+            current_chat.id, photo=source, **kwargs)
+
+    else:
+        with open(source, 'rb') as photo_file:
+            sent_message = current_chat.bot.send_photo(
+                current_chat.id, photo=photo_file, **kwargs)
+
+    if sent_message is not None and sent_message.photo:
+        media_store_file_id(config, media_key, sent_message.photo[-1].file_id)
+
+    return(sent_message)
+
+
+async def media_deliver_photo_async(current_chat: telegram.Chat, source: str, **kwargs) -> telegram.Message:
+
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
+    loop = asyncio.get_running_loop()
+
+    # Hashing and reading the file must not block the event loop
+    media_key = await loop.run_in_executor(None, media_get_key, source)
+    file_id = media_get_cache(config).get(media_key)
+    metrics_exporter.metrics_count(
+        'mosaic_cache_requests_total', (('cache', 'media'), ('result', 'miss' if file_id is None else 'hit')))
+
+    if file_id is not None:
+        try:
+            my_logger.info('Sending cached photo %s', media_key)
+            return(await current_chat.bot.send_photo(current_chat.id, photo=file_id, **kwargs))
+
+        except BadRequest as err:
+            my_logger.warning('Cached photo %s rejected: %s', media_key, err)
+
+    my_logger.info('Uploading photo %s', source)
+    if source.startswith(('http://', 'https://')):
+        photo = source
+
+    else:
+        photo = await loop.run_in_executor(None, media_read_file, source)
+
+    sent_message = await current_chat.bot.send_photo(current_chat.id, photo=photo, **kwargs)
+
+    if sent_message is not None and sent_message.photo:
+        await loop.run_in_executor(None, media_store_file_id, config, media_key,
+                                   sent_message.photo[-1].file_id)
+
+    return(sent_message)
+
+
+def media_read_file(source: str) -> bytes:
+
+    with open(source, 'rb') as media_file:
+        return(media_file.read())
+
+
+def media_get_key(source: str) -> str:
+
+    # Remote media is only known by its url, Telegram fetches the content
+    if source.startswith(('http://', 'https://')):
+        return(source)
+
+    media_path = os.path.abspath(source)
+    file_stat = os.stat(media_path)
+    hash_key = (media_path, file_stat.st_mtime_ns, file_stat.st_size)
+
+    content_hash = media_hashes.get(hash_key)
+    if content_hash is None:
+        with open(media_path, 'rb') as media_file:
+            content_hash = hashlib.sha256(media_file.read()).hexdigest()
+
+        media_hashes[hash_key] = content_hash
+
+    return(f'{media_path}#{content_hash}')
+
+
+def media_get_cache_filename(config: dict) -> str:
+
+    return(config.get('media_cache_file', f'{config["data_path"]}/media_cache.{FILE_TYPE}'))
+
+
+def media_get_cache(config: dict) -> dict:
+
+    global media_cache
+
+    if media_cache is not None:
+        return(media_cache)
+
+    with media_lock:
+        if media_cache is None:
+            try:
+                with open(media_get_cache_filename(config)) as cache_file:
+                    media_cache = json.load(cache_file)
 
-    my_logger.info(f'Sending message')
-    blog_entry_send(my_update, message)
+            except (OSError, ValueError) as err:
+                my_logger.warning('Media cache not loaded: %s', err)
+                media_cache = {}
+
+    return(media_cache)
+
+
+def media_store_file_id(config: dict, media_key: str, file_id: str):
+
+    global media_cache
+
+    media_get_cache(config)
+
+    with media_lock:
+        cache = dict(media_cache)
+        cache[media_key] = file_id
+
+        cache_filename = media_get_cache_filename(config)
+        try:
+            with open(f'{cache_filename}.tmp', 'w') as cache_file:
+                json.dump(cache, cache_file)
+
+            os.replace(f'{cache_filename}.tmp', cache_filename)
+            my_logger.info('File id of %s stored', media_key)
+
+        except OSError as err:
+            my_logger.error('%s: %s', error["os_err"], err)
+
+        media_cache = cache
 
 
 def create_top_level_keyboard(language: str) -> list:
 
-    my_logger.info(f'Creating top level menu')
+    my_logger.info('Creating top level menu')
 
     button = [
         create_abstract_button(BUTTON_FUNCTION['command'], KEYBOARD_LAYER['main'], KEYBOARD_BUTTONS['last'], get_button_caption(
@@ -258,7 +911,7 @@ def create_top_level_keyboard(language: str) -> list:
                  telegram.InlineKeyboardButton(button[1]['caption'], callback_data=create_callback_from_abstract(button[1]))],
                 [telegram.InlineKeyboardButton(button[2]['caption'], callback_data=create_callback_from_abstract(button[2]))]]
 
-    my_logger.info(f'Keyboard list created: {keyboard}')
+    my_logger.info('Keyboard list created: %s', keyboard)
 
     return(keyboard)
 
@@ -297,22 +950,13 @@ def create_callback_from_abstract(button: dict) -> str:
 def get_button_caption(button_type: str, language: str) -> telegram.InlineKeyboardButton:
 
     try:
-        message_filename = f'{os.path.abspath(os.path.dirname(__file__))}/messages.json'
-        my_logger.info(f'Message file: {message_filename}')
-
-        with open(message_filename) as message_file:
-            messages = json.load(message_file)
-            message_file.close()
-
-        buttons = messages['buttons']
-
-        button_caption = buttons[button_type]['caption'][language]
-        my_logger.info(f'Button caption: {button_caption}')
+        button_caption = catalog_lookup('buttons', button_type, language)
+        my_logger.info('Button caption: %s', button_caption)
 
         return(button_caption)
 
     except OSError as err:
-        my_logger.error(f'{error["os_err"]}: {err}')
+        my_logger.error('%s: %s', error["os_err"], err)
 
     except:
         my_logger.error(error['common'])
@@ -320,39 +964,33 @@ def get_button_caption(button_type: str, language: str) -> telegram.InlineKeyboa
 
 def send_year_menu(my_update: telegram.update, button: dict):
 
-    my_logger.info(f'Creating calendar menu')
+    my_logger.info('Creating calendar menu')
 
     language = get_language_code(my_update.effective_user)
 
-    menu = create_calender_menu(KEYBOARD_LAYER['year'], button['value'])
-
-    menu.append([telegram.InlineKeyboardButton(get_button_caption(
-        KEYBOARD_BUTTONS['top'], language), callback_data=f'c_{KEYBOARD_LAYER["year"]}_top')])
-
-    inline_keyboard = telegram.InlineKeyboardMarkup(menu)
+    inline_keyboard = get_keyboard_markup(
+        KEYBOARD_LAYER['year'], button['value'], language)
 
-    my_logger.info(f'Sending the message including keyboard')
+    my_logger.info('Sending the message including keyboard')
 
-    my_update.effective_chat.bot.editMessageReplyMarkup(
+    message_delivery.delivery_submit(
+        my_update.effective_chat.id, my_update.effective_chat.bot.editMessageReplyMarkup,
         chat_id=my_update.effective_chat.id, message_id=my_update.effective_message.message_id,
         reply_markup=inline_keyboard, disable_web_page_preview=True)
 
 
 def send_month_menu(my_update: telegram.update, button: dict):
 
-    my_logger.info(f'Creating calendar menu')
+    my_logger.info('Creating calendar menu')
 
     language = get_language_code(my_update.effective_user)
 
-    menu = create_calender_menu(KEYBOARD_LAYER['month'], button['value'])
+    inline_keyboard = get_keyboard_markup(
+        KEYBOARD_LAYER['month'], button['value'], language)
 
-    menu.append([telegram.InlineKeyboardButton(get_button_caption(
-        KEYBOARD_BUTTONS['top'], language), callback_data=f'c_{KEYBOARD_LAYER["month"]}_top')])
-
-    inline_keyboard = telegram.InlineKeyboardMarkup(menu)
-
-    my_logger.info(f'Sending the message including keyboard')
-    my_update.effective_chat.bot.editMessageReplyMarkup(
+    my_logger.info('Sending the message including keyboard')
+    message_delivery.delivery_submit(
+        my_update.effective_chat.id, my_update.effective_chat.bot.editMessageReplyMarkup,
         chat_id=my_update.effective_chat.id, message_id=my_update.effective_message.message_id,
         text=f'*{get_message_text("month_keyboard", language)}*', parse_mode='Markdown',
         reply_markup=inline_keyboard, disable_web_page_preview=True)
@@ -360,27 +998,61 @@ def send_month_menu(my_update: telegram.update, button: dict):
 
 def send_day_menu(my_update: telegram.update, button: dict):
 
-    my_logger.info(f'Creating calendar menu')
+    my_logger.info('Creating calendar menu')
 
     language = get_language_code(my_update.effective_user)
 
-    menu = create_calender_menu(KEYBOARD_LAYER['day'], button['value'])
-
-    menu.append([telegram.InlineKeyboardButton(get_button_caption(
-        KEYBOARD_BUTTONS['top'], language), callback_data=f'c_{KEYBOARD_LAYER["day"]}_top')])
-
-    inline_keyboard = telegram.InlineKeyboardMarkup(menu)
+    inline_keyboard = get_keyboard_markup(
+        KEYBOARD_LAYER['day'], button['value'], language)
 
-    my_logger.info(f'Sending the message including keyboard')
-    my_update.effective_chat.bot.editMessageReplyMarkup(
+    my_logger.info('Sending the message including keyboard')
+    message_delivery.delivery_submit(
+        my_update.effective_chat.id, my_update.effective_chat.bot.editMessageReplyMarkup,
         chat_id=my_update.effective_chat.id, message_id=my_update.effective_message.message_id,
         text=f'*{get_message_text("day_keyboard", language)}*', parse_mode='Markdown',
         reply_markup=inline_keyboard, disable_web_page_preview=True)
 
 
+def get_keyboard_markup(layer: str, choice: str, language: str) -> telegram.InlineKeyboardMarkup:
+
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
+
+    # The cache belongs to the snapshot and is dropped together with it
+    keyboards = data_get_snapshot(config)['keyboards']
+    keyboard_key = (layer, choice, language)
+
+    inline_keyboard = keyboards.get(keyboard_key)
+    if inline_keyboard is not None:
+        metrics_exporter.metrics_count('mosaic_cache_requests_total', (('cache', 'keyboard'), ('result', 'hit')))
+        return(inline_keyboard)
+
+    metrics_exporter.metrics_count('mosaic_cache_requests_total', (('cache', 'keyboard'), ('result', 'miss')))
+    return(coalesce_call(('keyboard', ) + keyboard_key, create_keyboard_markup, keyboards, keyboard_key))
+
+
+def create_keyboard_markup(keyboards: dict, keyboard_key: tuple) -> telegram.InlineKeyboardMarkup:
+
+    layer, choice, language = keyboard_key
+    my_logger.info('Creating keyboard markup for %s', keyboard_key)
+
+    if layer == KEYBOARD_LAYER['main']:
+        menu = create_top_level_keyboard(language)
+
+    else:
+        menu = create_calender_menu(layer, choice)
+
+        menu.append([telegram.InlineKeyboardButton(get_button_caption(
+            KEYBOARD_BUTTONS['top'], language), callback_data=f'c_{layer}_top')])
+
+    inline_keyboard = telegram.InlineKeyboardMarkup(menu)
+    keyboards[keyboard_key] = inline_keyboard
+
+    return(inline_keyboard)
+
+
 def create_calender_menu(layer: int, choice: str) -> list:
 
-    my_logger.info(f'Start creating the mosaic calendar menu')
+    my_logger.info('Start creating the mosaic calendar menu')
 
     n_rows = 6
 
@@ -388,7 +1060,7 @@ def create_calender_menu(layer: int, choice: str) -> list:
 
     menu = [buttons[i:i + n_rows] for i in range(0, len(buttons), n_rows)]
 
-    my_logger.info(f'Creating the dynamic menu finished')
+    my_logger.info('Creating the dynamic menu finished')
 
     return(menu)
 
@@ -436,35 +1108,35 @@ def get_calendar_from_blog(kind: str) -> dict:
     try:
         config = get_config(os.path.abspath(os.path.dirname(__file__)))
 
-        mosaic_blog = data_read_blog_from_file(config)
+        snapshot = data_get_snapshot(config)
 
-        calendar = {}
-        for entry in mosaic_blog:
-            if entry['kind'] == kind:
-                year = get_date_part(entry['date'], KEYBOARD_LAYER['year'])
-                month = get_date_part(entry['date'], KEYBOARD_LAYER['month'])
-                day = get_date_part(entry['date'], KEYBOARD_LAYER['day'])
+        return(snapshot['calendars'].get(kind, {}))
 
-                if year not in calendar.keys():
-                    calendar[year] = {}
-                    calendar[year][month] = [day]
+    except OSError as err:
+        my_logger.error('%s: %s', error["os_err"], err)
 
-                else:
-                    if month not in calendar[year].keys():
-                        calendar[year][month] = [day]
+    except:
+        my_logger.error(error['common'])
 
-                    else:
-                        calendar[year][month].append(day)
 
-        sorted_calendar = sort_calendar(calendar)
+def data_build_calendars(blog_dates) -> dict:
 
-        return(sorted_calendar)
+    my_logger.info('Building the calendars of the blog')
 
-    except OSError as err:
-        my_logger.error(f'{error["os_err"]}: {err}')
+    calendars = {}
+    for kind, date in blog_dates:
+        calendar = calendars.setdefault(kind, {})
 
-    except:
-        my_logger.error(error['common'])
+        year = get_date_part(date, KEYBOARD_LAYER['year'])
+        month = get_date_part(date, KEYBOARD_LAYER['month'])
+        day = get_date_part(date, KEYBOARD_LAYER['day'])
+
+        calendar.setdefault(year, {}).setdefault(month, []).append(day)
+
+    for kind in calendars:
+        calendars[kind] = sort_calendar(calendars[kind])
+
+    return(calendars)
 
 
 def get_date_part(date: str, part: int) -> str:
@@ -477,106 +1149,121 @@ def get_date_part(date: str, part: int) -> str:
         return(date[8:10])
 
 
-def blog_entry_create(language: str, blog_entry: dict) -> dict:
+def blog_entry_create(language: str, blog_entry: entry_model.BlogEntry) -> dict:
+
+    my_logger.info('Create blog entry')
+    language_index = entry_model.LANGUAGE_INDEX.get(language, 0)
 
-    my_logger.info(f'Create blog entry')
-    message = {'date': blog_entry['date'],
-               'title': blog_entry[f'title_{language}'],
-               'text': blog_entry[f'text_{language}'],
-               'permalink': blog_entry['permalink'],
-               'kind': blog_entry['kind']
+    message = {'date': blog_entry.date_text,
+               'title': blog_entry.title[language_index],
+               'text': blog_entry.text[language_index],
+               'permalink': blog_entry.permalink,
+               'kind': blog_entry.kind,
+               'media_type': blog_entry.media_type,
+               'media_url': blog_entry.media_url[language_index],
+               'media_caption': blog_entry.media_caption[language_index]
                }
 
-    if blog_entry['kind'] == 'mosaic':
-        message['media_type'] = blog_entry['media_type']
+    my_logger.info('Blog entry: %s', message)
+    return(message)
 
-        if blog_entry['media_type'].lower() == 'image' and blog_entry['image'] != 'false':
-            my_logger.info(
-                f'Blog entry contains image: {blog_entry["image"]["url"]}')
-            message.update({'image_url': blog_entry['image']['url']})
-            message.update({'image_caption': blog_entry['image']['caption']})
 
-        elif blog_entry['media_type'].lower() == 'video':
-            my_logger.info(f'Message contains video')
-            message.update(
-                {'video_url': blog_entry[f'video_{language}']['url']})
-            message.update(
-                {'video_title': blog_entry[f'video_{language}']['title']})
+def get_blog_entry_message(blog_entry: entry_model.BlogEntry, language: str) -> str:
 
-        elif blog_entry['media_type'].lower() == 'youtube':
-            my_logger.info(f'Message contains youtube video')
-            message.update(
-                {'video_url': f'https://www.youtube.com/watch?v={blog_entry["youtube_de"]}'})
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
 
-        else:
-            my_logger.info(f'Message contains no image and no video')
-            message.update({'image_url': ''})
-            message.update({'image_caption': ''})
+    # Entries of the SQLite store are rendered on their first request
+    snapshot = data_get_snapshot(config)
+    messages = snapshot['messages']
+    message_key = (blog_entry.date_text, language)
+    is_bounded = snapshot['backend'] == 'sqlite'
+
+    with message_lock:
+        message_text = messages.get(message_key)
+        if message_text is not None and is_bounded:
+            messages.move_to_end(message_key)
+
+    if message_text is None:
+        metrics_exporter.metrics_count('mosaic_cache_requests_total', (('cache', 'message'), ('result', 'miss')))
+        message_text = blog_entry_render(blog_entry, language)
+
+        with message_lock:
+            messages[message_key] = message_text
+            if is_bounded and len(messages) > MESSAGE_CACHE_SIZE:
+                messages.popitem(last=False)
 
     else:
-        blog_entry['media_type'] = ''
+        metrics_exporter.metrics_count('mosaic_cache_requests_total', (('cache', 'message'), ('result', 'hit')))
 
-    my_logger.info(f'Blog entry: {message}')
-    return(message)
+    return(message_text)
 
 
-def blog_entry_send(my_update: telegram.update, message: dict):
+def blog_entry_render(blog_entry: entry_model.BlogEntry, language: str) -> str:
 
-    my_logger.info(f'Send blog entry')
-    current_chat = my_update.effective_chat
+    message = blog_entry_create(language, blog_entry)
 
-    if message['media_type'].lower() == 'image':
-        url = message['image_url']
+    if len(message['media_caption']) > 0:
+        caption = message['media_caption']
+    else:
+        caption = message['media_url']
 
-        if 'image_caption' in message and len(message['image_caption']) > 0:
-            caption = message['image_caption']
-        else:
-            caption = message['image_url']
+    # The feed is plain text, escaping it for HTML keeps Telegram from rejecting it
+    message_text = (f'<b>{html.escape(get_localized_date(message["date"], language), quote=False)}</b>\n'
+                    f'<b>{html.escape(message["title"], quote=False)}</b>\n'
+                    f'{html.escape(message["text"], quote=False)}')
 
-    elif (message['media_type'].lower() == 'video') or (message['media_type'].lower() == 'youtube'):
-        url = message['video_url']
+    if message['media_url']:
+        message_text = (f'{message_text}\n\n<a href="{html.escape(message["media_url"])}">'
+                        f'{html.escape(caption, quote=False)}</a>')
 
-        if 'video_title' in message and len(message['video_title']) > 0:
-            caption = message['video_title']
-        else:
-            caption = message['video_url']
+    return(message_text)
 
-    else:
-        url = ''
-        caption = ''
 
-    my_logger.info(f'Create message')
-    message_text = f'*{get_localized_date(message["date"], my_update)}*\n*{message["title"]}*\n{message["text"]}\n\n[{caption}]({url})'
+def blog_entry_send(my_update: telegram.update, message_text: str):
 
-    my_logger.info(f'Send message')
-    current_chat.bot.send_message(current_chat.id, text=message_text,
-                                  parse_mode=telegram.ParseMode.MARKDOWN, disable_web_page_preview=False)
+    my_logger.info('Send blog entry')
+    current_chat = my_update.effective_chat
 
-    send_top_level_keyboard(my_update)
+    config = get_config(os.path.abspath(os.path.dirname(__file__)))
 
+    # One message carries the entry and the keyboard for the next choice
+    if response_is_combined(config):
+        user_language = get_language_code(my_update.effective_user)
 
-def get_localized_date(date: str, my_update: telegram.update) -> str:
+        my_logger.info('Send message including keyboard')
+        message_delivery.delivery_submit(
+            current_chat.id, current_chat.bot.send_message, current_chat.id, text=message_text,
+            parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=False,
+            reply_markup=get_keyboard_markup(KEYBOARD_LAYER['main'], '', user_language))
+        return
 
-    language = get_language_code(my_update.effective_user)
+    my_logger.info('Send message')
+    message_delivery.delivery_submit(
+        current_chat.id, current_chat.bot.send_message, current_chat.id, text=message_text,
+        parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=False)
 
-    if language == 'de':
-        locale_code = 'de_DE.utf8'
+    send_top_level_keyboard(my_update)
 
-    else:
-        locale_code = 'en_US.utf8'
 
-    locale.setlocale(locale.LC_ALL, locale_code)
+def get_localized_date(date: str, language: str) -> str:
 
-    local_date = datetime.datetime.strptime(
-        date, "%Y-%m-%d").date().strftime("%d %B %Y")
+    date_key = (date, language)
+
+    local_date = localized_dates.get(date_key)
+    if local_date is None:
+        month_names = MONTH_NAMES.get(language, MONTH_NAMES[FALLBACK_LANGUAGE])
+        month = month_names[int(get_date_part(date, KEYBOARD_LAYER['month'])) - 1]
+
+        local_date = f'{get_date_part(date, KEYBOARD_LAYER["day"])} {month} {get_date_part(date, KEYBOARD_LAYER["year"])}'
+        localized_dates[date_key] = local_date
 
     return(local_date)
 
 
 def get_language_code(user: telegram.User) -> str:
 
-    my_logger.info(f'Try to get language of the user')
-    my_logger.info(f'User language: {user.language_code.lower()}')
+    my_logger.info('Try to get language of the user')
+    my_logger.info('User language: %s', user.language_code.lower())
     if user.language_code.lower() == 'de':
         return('de')
 
@@ -589,16 +1276,17 @@ def get_blog_entry_by_date(date: str) -> dict:
     try:
         config = get_config(os.path.abspath(os.path.dirname(__file__)))
 
-        mosaic_blog = data_read_blog_from_file(config)
+        snapshot = data_get_snapshot(config)
 
-        for entry in mosaic_blog:
-            if entry['date'] == date:
-                return(entry)
+        if snapshot['backend'] == 'sqlite':
+            blog_entry = entry_store.store_get_entry_by_date(
+                entry_store.store_connect(config), date)
+            return(entry_model.entry_create(blog_entry) if blog_entry is not None else '')
 
-        return('')
+        return(snapshot['entries_by_date'].get(date, ''))
 
     except OSError as err:
-        my_logger.error(f'{error["os_err"]}: {err}')
+        my_logger.error('%s: %s', error["os_err"], err)
 
     except:
         my_logger.error(error['common'])
@@ -609,43 +1297,37 @@ def get_blog_entry_latest(mode: str) -> dict:
     try:
         config = get_config(os.path.abspath(os.path.dirname(__file__)))
 
-        my_logger.info(f'Read blog from file')
-        mosaic_blog = data_read_blog_from_file(config)
+        snapshot = data_get_snapshot(config)
 
-        my_logger.info(f'Blog entry to show: {mode}')
+        my_logger.info('Blog entry to show: %s', mode)
         if mode == KEYBOARD_BUTTONS['last']:
             requested_date = datetime.date.today()
 
         elif mode == KEYBOARD_BUTTONS['second']:
             requested_date = datetime.date.today() - datetime.timedelta(days=1)
 
-        my_logger.info(f'Date to show: {requested_date}')
-        latest_entry = None
+        my_logger.info('Date to show: %s', requested_date)
 
-        for blog_entry in mosaic_blog:
-            blog_entry_date = datetime.datetime.strptime(
-                blog_entry['date'], '%Y-%m-%d').date()
-            my_logger.info(f'Date of the blog entry: {blog_entry_date}')
-            if blog_entry_date == requested_date:
-                my_logger.info(f'Blog entry for date {requested_date} found')
-                latest_entry = blog_entry
-                break
+        if snapshot['backend'] == 'sqlite':
+            blog_entry = entry_store.store_get_entry_latest(
+                entry_store.store_connect(config), requested_date.isoformat())
+            return(entry_model.entry_create(blog_entry) if blog_entry is not None else None)
 
-            else:
+        # Newest entry on or before the requested date
+        position = bisect.bisect_right(
+            snapshot['dates'], requested_date.isoformat())
 
-                if blog_entry_date < requested_date and latest_entry == None:
-                    my_logger.info(f'Blog entry is the first one found')
-                    latest_entry = blog_entry
+        if position == 0:
+            my_logger.info('No entry in mode %s found', mode)
+            return(None)
 
-                elif blog_entry_date < requested_date and blog_entry_date > datetime.datetime.strptime(latest_entry['date'], '%Y-%m-%d').date():
-                    my_logger.info(f'Blog entry is newer that the current one')
-                    latest_entry = blog_entry
+        latest_entry = snapshot['entries_by_date'][snapshot['dates'][position - 1]]
 
-        my_logger.info(f'Entry in mode {mode} found: {latest_entry}')
+        my_logger.info('Entry in mode %s found: %s', mode, latest_entry.date_text)
         return(latest_entry)
 
     except OSError as err:
-        my_logger.error(f'{error["os_err"]}: {err}')
+        my_logger.error('%s: %s', error["os_err"], err)
 
     except:
         my_logger.error(error['common'])
@@ -653,22 +1335,14 @@ def get_blog_entry_latest(mode: str) -> dict:
 
 def get_message_text(message_type: str, language: str) -> str:
 
-    my_logger.info(f'Read message from messages file')
-
     try:
-        message_filename = f'{os.path.abspath(os.path.dirname(__file__))}/messages.json'
-        my_logger.info(f'Message file: {message_filename}')
-        with open(message_filename) as message_file:
-            my_logger.info(f'Read message data')
-            messages = json.load(message_file)
-            message_file.close()
+        message = catalog_lookup('messages', message_type, language)
+        my_logger.info('Message found: %s', message)
 
-            my_logger.info(
-                f'Message found: {messages["messages"][message_type][language]}')
-            return(messages['messages'][message_type][language])
+        return(message)
 
     except OSError as err:
-        my_logger.error(f'{error["os_err"]}: {err}')
+        my_logger.error('%s: %s', error["os_err"], err)
         sys.exit()
 
     except:
@@ -676,27 +1350,117 @@ def get_message_text(message_type: str, language: str) -> str:
         sys.exit()
 
 
+def catalog_lookup(section: str, key: str, language: str) -> str:
+
+    catalog = message_catalog
+    if catalog is None:
+        catalog = catalog_reload()
+
+    for catalog_language in (language, FALLBACK_LANGUAGE):
+        text = catalog[section].get(catalog_language, {}).get(key)
+        if text is not None:
+            return(text)
+
+    raise KeyError(f'No {section} text {key} for language {language}')
+
+
+def catalog_load() -> dict:
+
+    message_filename = f'{os.path.abspath(os.path.dirname(__file__))}/messages.json'
+    my_logger.info('Message file: %s', message_filename)
+
+    with open(message_filename) as message_file:
+        messages = json.load(message_file)
+        message_file.close()
+
+    catalog = {
+        'messages': {},
+        'buttons': {}
+    }
+
+    for message_type, texts in messages['messages'].items():
+        for language, text in texts.items():
+            catalog['messages'].setdefault(language, {})[message_type] = text
+
+    for button_type, button in messages['buttons'].items():
+        for language, caption in button['caption'].items():
+            catalog['buttons'].setdefault(language, {})[button_type] = caption
+
+    return(catalog)
+
+
+def catalog_reload() -> dict:
+
+    global message_catalog
+
+    try:
+        my_logger.info('Loading the messages')
+        message_catalog = catalog_load()
+        my_logger.info('Messages loaded')
+
+        # Keyboards carry the old captions
+        snapshot = blog_snapshot
+        if snapshot is not None:
+            snapshot['keyboards'].clear()
+
+    except Exception as err:
+        if message_catalog is None:
+            raise
+
+        my_logger.error('%s: %s. Keeping loaded messages', error["common"], err)
+
+    return(message_catalog)
+
+
 def get_config(script_path: str) -> dict:
 
+    config = config_cache.get(script_path)
+    if config is None:
+        config = config_reload(script_path)
+
+    return(config)
+
+
+def config_reload(script_path: str) -> dict:
+
     try:
         config_file_name = f'{script_path}/config.json'
 
-        my_logger.info(f'Open configuration file: {config_file_name}')
+        my_logger.info('Open configuration file: %s', config_file_name)
         with open(config_file_name) as config_file:
             config_data = json.load(config_file)
             config_file.close()
-            my_logger.info(f'Read configuration successfull: {config_data}')
+            my_logger.info('Read configuration successfull: %s', config_data)
+
+        config_cache[script_path] = config_freeze(config_data)
+        log_pipeline.log_apply_levels(config_data)
 
-            return(config_data)
+        return(config_cache[script_path])
 
     except Exception as err:
-        my_logger.error(f'{error["common"]}: {err}')
+        my_logger.error('%s: %s', error["common"], err)
+
+        if script_path in config_cache:
+            my_logger.warning('Keeping the loaded configuration')
+            return(config_cache[script_path])
+
         sys.exit()
 
 
+def config_freeze(value):
+
+    if isinstance(value, dict):
+        return(types.MappingProxyType({key: config_freeze(item) for key, item in value.items()}))
+
+    elif isinstance(value, list):
+        return(tuple(config_freeze(item) for item in value))
+
+    return(value)
+
+
 def sort_calendar(calendar: dict) -> dict:
 
-    my_logger.info(f'Start sorting the calendar from the blog')
+    my_logger.info('Start sorting the calendar from the blog')
 
     sorted_calendar = {}
 
@@ -706,19 +1470,15 @@ def sort_calendar(calendar: dict) -> dict:
         for month in sorted(calendar[year].keys()):
             sorted_calendar[year][month] = sorted(calendar[year][month])
 
-    my_logger.info(f'Sorting the calendar finished')
+    my_logger.info('Sorting the calendar finished')
 
     return(sorted_calendar)
 
 
-my_logger = logging.getLogger()
-my_logger.level = logging.WARNING
-
-logfile_handler = RotatingFileHandler(
-    f'{os.path.abspath(os.path.dirname(__file__))}/log/{LOG_FILE}', maxBytes=1024000, backupCount=7)
-logfile_handler.setFormatter(logging.Formatter(
-    '%(asctime)s - %(funcName)s - %(message)s'))
-my_logger.addHandler(logfile_handler)
+my_logger = logging.getLogger('run_mosaic_bot')
 
 if __name__ == '__main__':
+    log_config = get_config(os.path.abspath(os.path.dirname(__file__)))
+    log_pipeline.log_start(log_config, [log_pipeline.log_create_file_handler(
+        log_config, f'{get_log_path()}/{LOG_FILE}')])
     main()
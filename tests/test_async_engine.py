@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import json
+import asyncio
+import unittest
+
+import async_engine
+
+API_TOKEN = '123456:TEST'
+API_RESPONSE = json.dumps({'ok': True, 'result': True}).encode('utf-8')
+
+
+class KeepAliveServer:
+
+    def __init__(self, idle_timeout: float, drop_reused: bool = False):
+
+        self.idle_timeout = idle_timeout
+        self.drop_reused = drop_reused
+        self.connections = 0
+        self.requests = 0
+        self.server = None
+
+    async def start(self) -> str:
+
+        self.server = await asyncio.start_server(self.serve, '127.0.0.1', 0)
+
+        return('http://127.0.0.1:{}'.format(self.server.sockets[0].getsockname()[1]))
+
+    async def stop(self):
+
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+
+        self.connections += 1
+        served = 0
+
+        try:
+            while True:
+                # Idle connections are closed like by the Bot API or a reverse proxy
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    return
+
+                content_length = 0
+                for line in head.decode('latin-1').split('\r\n'):
+                    if line.lower().startswith('content-length:'):
+                        content_length = int(line.split(':', 1)[1])
+                await reader.readexactly(content_length)
+
+                # A connection closed just when the next request arrives
+                if self.drop_reused and served > 0:
+                    return
+
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\n\r\n' % len(API_RESPONSE) + API_RESPONSE)
+                await writer.drain()
+
+                served += 1
+                self.requests += 1
+
+        finally:
+            writer.close()
+
+
+class ApiRequestTest(unittest.TestCase):
+
+    def run_requests(self, server: KeepAliveServer, idle_timeout: float, pause: float, calls: int = 8) -> list:
+
+        async def run() -> list:
+            api_url = await server.start()
+            try:
+                bot = async_engine.AsyncBot(API_TOKEN, dict(
+                    async_engine.ENGINE_DEFAULTS, api_url=api_url, idle_timeout=idle_timeout, request_timeout=5))
+
+                results = []
+                for _ in range(2):
+                    results += await asyncio.gather(*(
+                        bot.answer_callback_query(str(number)) for number in range(calls)))
+                    await asyncio.sleep(pause)
+
+                return(results)
+
+            finally:
+                await server.stop()
+
+        return(asyncio.run(run()))
+
+    def test_connections_closed_by_the_server_are_not_reused(self):
+
+        server = KeepAliveServer(idle_timeout=0.3)
+
+        self.assertEqual(self.run_requests(server, idle_timeout=20, pause=1), [True] * 16)
+        self.assertEqual(server.connections, 16)
+
+    def test_connection_closed_at_the_request_is_retried(self):
+
+        server = KeepAliveServer(idle_timeout=10, drop_reused=True)
+
+        self.assertEqual(self.run_requests(server, idle_timeout=20, pause=0.1), [True] * 16)
+        self.assertEqual(server.requests, 16)
+
+    def test_connections_past_the_idle_timeout_are_dropped(self):
+
+        server = KeepAliveServer(idle_timeout=10)
+
+        self.assertEqual(self.run_requests(server, idle_timeout=0.2, pause=0.5, calls=1), [True] * 2)
+        self.assertEqual(server.connections, 2)
+
+    def test_idle_connections_are_reused(self):
+
+        server = KeepAliveServer(idle_timeout=10)
+
+        self.assertEqual(self.run_requests(server, idle_timeout=20, pause=0.1, calls=4), [True] * 8)
+        self.assertEqual(server.connections, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+import os
+import gzip
+import json
+import time
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import file_download
+import entry_store
+
+FEED_BODY = b'{"blog": [{"date": "2019-10-18", "kind": "mosaic"}]}'
+
+
+class FeedRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        server = self.server
+        server.requests += 1
+
+        if self.path == '/unavailable':
+            # Fails until the configured number of requests was made
+            if server.requests <= server.failures:
+                self.send_feed_response(503, b'')
+            else:
+                self.send_feed_response(200, FEED_BODY)
+
+        elif self.path == '/stalled':
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(FEED_BODY)))
+            self.end_headers()
+            self.wfile.write(FEED_BODY[:10])
+            self.wfile.flush()
+            server.release.wait(10)
+
+        elif self.path == '/feed':
+            self.send_feed_response(200, server.feed)
+
+        elif self.path == '/gzip':
+            server.accept_encoding = self.headers.get('Accept-Encoding', '')
+            self.send_feed_response(200, gzip.compress(FEED_BODY), {'Content-Encoding': 'gzip'})
+
+        else:
+            self.send_feed_response(404, b'')
+
+    def send_feed_response(self, status: int, body: bytes, headers: dict = None):
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+
+        pass
+
+
+class FeedServerTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FeedRequestHandler)
+        self.server.daemon_threads = True
+        self.server.requests = 0
+        self.server.failures = 0
+        self.server.release = threading.Event()
+        self.server.feed = FEED_BODY
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.config = {'http': {'connect_timeout': 1, 'read_timeout': 0.5, 'retries': 2, 'backoff_factor': 0}}
+        self.url = 'http://{}:{}'.format(*self.server.server_address)
+
+        # Every test starts with its own session and retry settings
+        file_download.http_session = None
+
+    def tearDown(self):
+
+        self.server.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+        if file_download.http_session is not None:
+            file_download.http_session.close()
+            file_download.http_session = None
+
+
+
+class HttpGetTest(FeedServerTest):
+
+    def test_server_error_is_retried(self):
+
+        self.server.failures = 2
+
+        response = file_download.http_get(self.config, f'{self.url}/unavailable')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, FEED_BODY)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_retries_are_limited(self):
+
+        self.server.failures = 10
+
+        response = file_download.http_get(self.config, f'{self.url}/unavailable')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.requests, 3)
+        with self.assertRaises(requests.HTTPError):
+            response.raise_for_status()
+
+    def test_stalled_read_times_out(self):
+
+        started = time.monotonic()
+        response = file_download.http_get(self.config, f'{self.url}/stalled')
+
+        with self.assertRaises(requests.RequestException):
+            for _ in response.iter_content(file_download.CHUNK_SIZE):
+                pass
+
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_gzip_is_decoded(self):
+
+        response = file_download.http_get(self.config, f'{self.url}/gzip')
+
+        self.assertIn('gzip', self.server.accept_encoding)
+        self.assertEqual(b''.join(response.iter_content(file_download.CHUNK_SIZE)), FEED_BODY)
+
+
+class DataUpdateTest(FeedServerTest):
+
+    def test_malformed_entries_are_left_out_of_the_store(self):
+
+        blog = [
+            {'date': '2019-10-01', 'kind': 'mosaic', 'permalink': 'a'},
+            {'date': '2019-10-02', 'permalink': 'no kind'},
+            {'date': None, 'kind': 'news', 'permalink': 'no date'},
+            {'date': '2019-10-03', 'kind': 'news', 'permalink': 'b'}
+        ]
+        self.server.feed = json.dumps({'blog': blog}).encode('utf-8')
+
+        with tempfile.TemporaryDirectory() as data_path:
+            config = dict(self.config, data_path=data_path, data_file='mosaic_data', storage='sqlite',
+                          mosaic_url=f'{self.url}/feed')
+
+            self.assertTrue(file_download.data_update(config))
+
+            connection = entry_store.store_connect(config)
+            try:
+                self.assertEqual([entry['permalink'] for entry in entry_store.store_get_blog(connection)], ['a', 'b'])
+
+            finally:
+                connection.close()
+                entry_store.store_connections.connection = None
+
+            self.assertTrue(os.path.exists(f'{data_path}/mosaic_data.json'))
+            self.assertIn('sha256', file_download.data_read_state(config))
+
+
+class DataIngestTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.data_path = tempfile.TemporaryDirectory()
+        self.config = {'data_path': self.data_path.name, 'data_file': 'mosaic_data'}
+
+    def tearDown(self):
+
+        self.data_path.cleanup()
+
+    def test_changes_are_found_by_digest(self):
+
+        active_blog = [
+            {'date': '2019-10-01', 'kind': 'mosaic', 'permalink': 'a', 'title_en': 'Old'},
+            {'date': '2019-10-02', 'kind': 'news', 'permalink': 'b'},
+            {'date': '2019-10-03', 'kind': 'news', 'permalink': 'c'}
+        ]
+        new_blog = [
+            {'permalink': 'a', 'title_en': 'New', 'kind': 'mosaic', 'date': '2019-10-01'},
+            {'permalink': 'b', 'kind': 'news', 'date': '2019-10-02'},
+            {'date': '2019-10-04', 'kind': 'weekly', 'permalink': 'd'}
+        ]
+
+        with open(f'{self.data_path.name}/mosaic_data.json', 'w') as data_file:
+            json.dump({'blog': active_blog}, data_file)
+
+        changes = file_download.data_ingest(file_download.data_read_digests(self.config), new_blog, self.config)
+
+        self.assertEqual([entry['permalink'] for entry in changes['added']], ['d'])
+        self.assertEqual([entry['permalink'] for entry in changes['changed']], ['a'])
+        self.assertEqual(changes['removed'], [{'date': '2019-10-03', 'permalink': 'c'}])
+        self.assertTrue(os.path.exists(file_download.data_get_changes_filename(self.config)))
+
+    def test_without_active_data_everything_is_added(self):
+
+        changes = file_download.data_ingest(
+            file_download.data_read_digests(self.config), [{'date': '2019-10-01', 'kind': 'news'}], self.config)
+
+        self.assertEqual(len(changes['added']), 1)
+        self.assertEqual(changes['changed'] + changes['removed'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
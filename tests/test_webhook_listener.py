@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import json
+import queue
+import unittest
+import http.client
+
+import webhook_listener
+
+SECRET_TOKEN = 'mosaic_secret'
+
+
+class WebhookListenerTest(unittest.TestCase):
+
+    def setUp(self):
+
+        settings = dict(webhook_listener.WEBHOOK_DEFAULTS, port=0, secret_token=SECRET_TOKEN)
+
+        self.update_queue = queue.Queue()
+        self.server = webhook_listener.webhook_start(settings, None, self.update_queue)
+        self.path = settings['path']
+
+    def tearDown(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, body: bytes, secret_token: str = SECRET_TOKEN) -> int:
+
+        connection = http.client.HTTPConnection(*self.server.server_address, timeout=5)
+        try:
+            connection.putrequest('POST', self.path)
+            connection.putheader('Content-Type', 'application/json')
+            connection.putheader('Content-Length', str(len(body)))
+            connection.putheader(webhook_listener.SECRET_HEADER, secret_token.encode('utf-8'))
+            connection.endheaders(body)
+
+            return(connection.getresponse().status)
+
+        finally:
+            connection.close()
+
+    def test_update_is_queued(self):
+
+        update_data = {
+            'update_id': 1,
+            'message': {
+                'message_id': 2,
+                'date': 1570000000,
+                'chat': {'id': 3, 'type': 'private'},
+                'text': '/start'
+            }
+        }
+
+        self.assertEqual(self.post(json.dumps(update_data).encode('utf-8')), 200)
+
+        update = self.update_queue.get(timeout=5)
+        self.assertEqual(update.update_id, 1)
+        self.assertEqual(update.message.text, '/start')
+
+    def test_invalid_updates_are_rejected(self):
+
+        for body in (b'[1, 2]', b'{}', b'"update"', b'{"update_id": 1', b''):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body), 400)
+
+        self.assertTrue(self.update_queue.empty())
+
+    def test_wrong_secret_token_is_rejected(self):
+
+        body = json.dumps({'update_id': 1}).encode('utf-8')
+
+        self.assertEqual(self.post(body, 'wrong'), 403)
+        self.assertEqual(self.post(body, 'gehéim'), 403)
+        self.assertTrue(self.update_queue.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
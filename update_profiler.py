@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+import time
+import cProfile
+import pstats
+import datetime
+import threading
+import logging
+
+# Defaults for the profiling settings in config.json, updates 0 means no limit
+PROFILING_DEFAULTS = {
+    'enabled': True,
+    'seconds': 30,
+    'updates': 0
+}
+
+# Functions listed with their totals at the top of every report, first the handlers
+# preparing the answers, then the delivery workers making the Bot API calls
+PROFILE_FUNCTIONS = ('data_get_snapshot', 'get_calendar_from_blog', 'get_keyboard_markup', 'get_blog_entry_by_date',
+                     'get_blog_entry_latest', 'get_blog_entry_message',
+                     'delivery_execute', 'media_deliver_photo', 'send_message', 'send_photo',
+                     'edit_message_reply_markup', 'answer_callback_query')
+
+# One profile per handler and delivery thread while a session is active, guarded by the lock
+profiler = {
+    'lock': threading.Lock(),
+    'active': False,
+    'profiles': {},
+    'running': 0,
+    'updates': 0,
+    'updates_limit': 0,
+    'deadline': 0.0,
+    'started': 0.0,
+    'timer': None,
+    'log_path': ''
+}
+
+
+def profiler_get_settings(config: dict) -> dict:
+
+    settings = dict(PROFILING_DEFAULTS)
+    settings.update(config.get('profiling', {}))
+
+    return(settings)
+
+
+def profiler_wrap_handler(config: dict, callback):
+
+    if not profiler_get_settings(config)['enabled']:
+        return(callback)
+
+    def profiled_callback(*args):
+        # Outside a session the handler runs without any profiler attached
+        if not profiler['active']:
+            return(callback(*args))
+
+        return(profiler_run(callback, args))
+
+    return(profiled_callback)
+
+
+def profiler_start(config: dict, log_path: str, seconds: float = None, updates: int = None) -> bool:
+
+    settings = profiler_get_settings(config)
+    seconds = settings['seconds'] if seconds is None else seconds
+    updates = settings['updates'] if updates is None else updates
+
+    with profiler['lock']:
+        # A finished session is reported before the next one starts
+        if profiler['active'] or profiler['profiles']:
+            return(False)
+
+        now = time.monotonic()
+        profiler.update({
+            'active': True,
+            'updates': 0,
+            'updates_limit': updates,
+            'deadline': now + seconds,
+            'started': now,
+            'log_path': log_path
+        })
+
+        profiler['timer'] = threading.Timer(seconds, profiler_stop)
+        profiler['timer'].daemon = True
+        profiler['timer'].start()
+
+    my_logger.warning('Profiling started for %s seconds, update limit %s', seconds, updates or 'none')
+
+    return(True)
+
+
+def profiler_stop() -> bool:
+
+    with profiler['lock']:
+        if not profiler['active']:
+            return(False)
+
+        profiler['active'] = False
+        report = profiler_take_report()
+
+    if report is not None:
+        profiler_write_report(report)
+
+    return(True)
+
+
+def profiler_is_active() -> bool:
+
+    return(profiler['active'])
+
+
+def profiler_run(callback, args: tuple, is_update: bool = True):
+
+    thread_id = threading.get_ident()
+
+    with profiler['lock']:
+        profile = profiler['profiles'].get(thread_id)
+        if profile is None:
+            profile = cProfile.Profile()
+            profiler['profiles'][thread_id] = profile
+
+        profiler['running'] += 1
+
+    try:
+        try:
+            profile.enable()
+
+        except ValueError as err:
+            # Only one profiler can be active at a time on newer interpreters
+            my_logger.debug('Update not profiled: %s', err)
+            return(callback(*args))
+
+        try:
+            return(callback(*args))
+
+        finally:
+            profile.disable()
+
+    finally:
+        with profiler['lock']:
+            profiler['running'] -= 1
+            if is_update:
+                profiler['updates'] += 1
+
+            if profiler['active'] and (
+                    time.monotonic() >= profiler['deadline'] or
+                    0 < profiler['updates_limit'] <= profiler['updates']):
+                profiler['active'] = False
+
+            report = profiler_take_report()
+
+        if report is not None:
+            profiler_write_report(report)
+
+
+def profiler_take_report() -> dict:
+
+    # Called with the lock held, profiles are only read after their last handler returned
+    if profiler['active'] or profiler['running'] > 0 or not profiler['profiles']:
+        return(None)
+
+    if profiler['timer'] is not None:
+        profiler['timer'].cancel()
+        profiler['timer'] = None
+
+    report = {
+        'profiles': list(profiler['profiles'].values()),
+        'updates': profiler['updates'],
+        'seconds': time.monotonic() - profiler['started'],
+        'log_path': profiler['log_path']
+    }
+    profiler['profiles'] = {}
+
+    return(report)
+
+
+def profiler_write_report(report: dict):
+
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    report_filename = f'{report["log_path"]}/profile_{timestamp}'
+
+    try:
+        stats = pstats.Stats(report['profiles'][0])
+        for profile in report['profiles'][1:]:
+            stats.add(profile)
+
+        stats.dump_stats(f'{report_filename}.pstats')
+
+        with open(f'{report_filename}.txt', 'w') as report_file:
+            report_file.write(f'{report["updates"]} updates profiled in {report["seconds"]:.1f} seconds\n\n')
+            report_file.write(f'{"calls":>10} {"total":>10} {"cumulative":>10}  function\n')
+
+            for (filename, line, function), (_, calls, total, cumulative, _) in sorted(
+                    stats.stats.items(), key=lambda item: -item[1][3]):
+                if function in PROFILE_FUNCTIONS:
+                    report_file.write(f'{calls:>10} {total:>10.4f} {cumulative:>10.4f}  {function} ({filename}:{line})\n')
+
+            report_file.write('\n')
+            stats.stream = report_file
+            stats.sort_stats('cumulative').print_stats(40)
+
+        my_logger.warning('Profile of %s updates written to %s.pstats', report['updates'], report_filename)
+
+    except (OSError, TypeError) as err:
+        my_logger.error('Profile could not be written: %s', err)
+
+
+my_logger = logging.getLogger('update_profiler')
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+import json
+import hmac
+import queue
+import signal
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import telegram
+import telegram.ext
+
+# Header Telegram uses to send the secret token of the webhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Updates are small, everything bigger is rejected
+MAX_BODY_SIZE = 1024000
+
+# Defaults for the webhook settings in config.json
+WEBHOOK_DEFAULTS = {
+    'listen': '127.0.0.1',
+    'port': 8443,
+    'path': '/mosaic_bot',
+    'url': '',
+    'secret_token': '',
+    'max_connections': 40
+}
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+
+        webhook = self.server.webhook
+
+        if self.path != webhook['path']:
+            self.send_webhook_response(404)
+            return
+
+        # Compared as bytes, header values outside of ASCII are only a mismatch
+        if webhook['secret_token'] and not hmac.compare_digest(
+                self.headers.get(SECRET_HEADER, '').encode('utf-8', 'surrogateescape'),
+                webhook['secret_token'].encode('utf-8')):
+            my_logger.warning('Webhook request with wrong secret token')
+            self.send_webhook_response(403)
+            return
+
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+
+        except ValueError:
+            content_length = 0
+
+        if content_length <= 0 or content_length > MAX_BODY_SIZE:
+            self.send_webhook_response(413 if content_length > 0 else 400)
+            return
+
+        try:
+            update_data = json.loads(self.rfile.read(content_length))
+            if not isinstance(update_data, dict) or 'update_id' not in update_data:
+                raise ValueError('not an update object')
+
+            update = telegram.Update.de_json(update_data, webhook['bot'])
+
+        except (ValueError, TypeError, KeyError, AttributeError) as err:
+            my_logger.error('Webhook request could not be read: %s', err)
+            self.send_webhook_response(400)
+            return
+
+        webhook['update_queue'].put(update)
+        self.send_webhook_response(200)
+
+    def do_GET(self):
+
+        self.send_webhook_response(405)
+
+    def send_webhook_response(self, status: int):
+
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format: str, *args):
+
+        my_logger.debug('Webhook %s: ' + format, self.address_string(), *args)
+
+
+def webhook_get_settings(config: dict) -> dict:
+
+    settings = dict(WEBHOOK_DEFAULTS)
+    settings.update(config.get('webhook', {}))
+
+    if not settings['path'].startswith('/'):
+        settings['path'] = f'/{settings["path"]}'
+
+    return(settings)
+
+
+def webhook_start(settings: dict, bot: telegram.Bot, update_queue: queue.Queue) -> ThreadingHTTPServer:
+
+    my_logger.info(
+        'Start webhook listener on %s:%s%s', settings["listen"], settings["port"], settings["path"])
+
+    server = ThreadingHTTPServer(
+        (settings['listen'], settings['port']), WebhookRequestHandler)
+    server.daemon_threads = True
+    server.webhook = {
+        'path': settings['path'],
+        'secret_token': settings['secret_token'],
+        'bot': bot,
+        'update_queue': update_queue
+    }
+
+    listener_thread = threading.Thread(
+        target=server.serve_forever, name='webhook_listener', daemon=True)
+    listener_thread.start()
+
+    return(server)
+
+
+def webhook_run(updater: telegram.ext.Updater, config: dict):
+
+    settings = webhook_get_settings(config)
+
+    server = webhook_start(settings, updater.bot, updater.update_queue)
+
+    dispatcher_ready = threading.Event()
+    dispatcher_thread = threading.Thread(
+        target=updater.dispatcher.start, name='dispatcher', kwargs={'ready': dispatcher_ready})
+    dispatcher_thread.start()
+    dispatcher_ready.wait()
+
+    if settings['url']:
+        my_logger.info('Register webhook %s', settings["url"])
+        webhook_options = {'max_connections': settings['max_connections']}
+        if settings['secret_token']:
+            webhook_options['secret_token'] = settings['secret_token']
+
+        updater.bot.set_webhook(url=settings['url'], **webhook_options)
+
+    else:
+        my_logger.warning('No webhook url configured, expecting a registered webhook')
+
+    stop_event = threading.Event()
+
+    def handler_stop(signum: int, frame):
+        my_logger.info('Signal %s received, stopping the webhook', signum)
+        stop_event.set()
+
+    for stop_signal in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+        signal.signal(stop_signal, handler_stop)
+
+    while not stop_event.wait(1):
+        pass
+
+    server.shutdown()
+    server.server_close()
+    updater.dispatcher.stop()
+    dispatcher_thread.join()
+
+    my_logger.info('Webhook stopped')
+
+
+my_logger = logging.getLogger('webhook_listener')